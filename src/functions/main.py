@@ -1,10 +1,95 @@
-from os import getenv
-from google.cloud import dataproc_v1 as dataproc
-from google.cloud import pubsub_v1 as pubsub
-from google.cloud import bigquery
-from google.cloud import storage
+# annotations are not evaluated, so the SDKs used in them are not imported at definition time
+from __future__ import annotations
+from os import getenv, path
+import importlib
+import subprocess
+import time
+from datetime import datetime
 import base64
 from ast import literal_eval
+import json
+import math
+import gzip
+import hashlib
+import uuid
+import concurrent.futures
+
+# Lazy imports
+class LazyModule:
+    """Module imported on its first attribute access.
+    The Google Cloud SDKs are slow to import, each entry point only loads the ones it uses.
+    """
+    def __init__(self, name:str):
+        self.name = name
+        self.module = None
+
+    def load(self):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return self.module
+
+    def __getattr__(self, attr:str):
+        return getattr(self.load(), attr)
+
+dataproc = LazyModule('google.cloud.dataproc_v1')
+pubsub   = LazyModule('google.cloud.pubsub_v1')
+bigquery = LazyModule('google.cloud.bigquery')
+storage  = LazyModule('google.cloud.storage')
+
+# SDKs loaded by each entry point (see tools/functions/benchmark.py)
+ENTRY_POINT_MODULES = {
+    'start_processing_pipeline': [pubsub],
+    'extract_transform': [dataproc, storage, pubsub],
+    'load': [bigquery, storage, dataproc],
+    'watch_job': [dataproc, pubsub, storage],
+}
+
+# Auto sizing
+MB = 1024 ** 2
+GB = 1024 ** 3
+# (max uncompressed input bytes, workers, worker machine type, vcpus per worker, worker disk GB)
+CLUSTER_SIZES = [
+    (1 * GB, 0, 'n1-standard-4', 4, 40),  # single node cluster
+    (4 * GB, 2, 'n1-standard-4', 4, 40),
+    (16 * GB, 4, 'n1-standard-4', 4, 100),
+    (64 * GB, 8, 'n1-highmem-4', 4, 200),
+    (None, 16, 'n1-highmem-8', 8, 500),
+]
+DEFAULT_CLUSTER_SIZE_INDEX = 1        # size used without auto sizing
+ZIP_COMPRESSION_RATIO = 5             # uncompressed / zipped size of the csv
+SHUFFLE_BYTES_PER_INPUT_BYTE = 0.1    # shuffle size estimate without a previous run
+SHUFFLE_PARTITION_BYTES = 128 * MB
+MIN_SPLIT_BYTES, MAX_SPLIT_BYTES = 16 * MB, 256 * MB
+RUN_METRICS_PREFIX = 'run_metrics'
+COMPLETION_MARKER_NAME = '_job_completed.json'  # written by the job once its completion message is published
+
+# Version of the completion message sent by the job
+MESSAGE_SCHEMA_VERSION = 1
+
+# Cluster states (reuse mode and back to back triggers)
+CLUSTER_READY_STATES = ('RUNNING', 'UPDATING')
+CLUSTER_PENDING_STATES = ('CREATING', 'STARTING', 'DELETING')  # waited for, the cluster is recreated after DELETING
+CLUSTER_POLL_DELAY = 15
+CLUSTER_WAIT_TIMEOUT = 420  # seconds, within the function timeout
+
+# Job watchdog
+JOB_TERMINAL_STATES = ('DONE', 'ERROR', 'CANCELLED')
+JOB_WAITING_STATES = ('PENDING', 'SETUP_DONE')
+WATCHDOG_FIRST_DELAY, WATCHDOG_MAX_DELAY = 10, 60  # seconds between two polls, doubled after each poll
+# serverless batch states, as job states
+BATCH_JOB_STATES = {'PENDING': 'PENDING', 'RUNNING': 'RUNNING', 'CANCELLING': 'RUNNING',
+                    'SUCCEEDED': 'DONE', 'FAILED': 'ERROR', 'CANCELLED': 'CANCELLED'}
+
+# Big Query tables layout (merge write mode)
+STAGING_TABLE_SUFFIX = '_staging'
+PARTITION_COLUMN = 'Year'
+PARTITION_RANGE = (2000, 2100)  # one integer range partition per year
+CLUSTER_COLUMNS = ['Primary Type', 'Location Description']
+MEASURE_COLUMNS = ['count', 'rank']  # updated in place, the other columns are the merge keys
+CONTENT_HASH_LABEL = 'content_hash'  # table label holding the content hash of the loaded report
+
+# Result cache: one entry per loaded run, addressed by its inputs (see get_result_key)
+RESULT_CACHE_PREFIX = 'result_cache'
 
 # Configuration
 def get_config()->dict:
@@ -26,7 +111,33 @@ def get_config()->dict:
         'load_topic_name': getenv('LOAD_TRANSFORM_TOPIC'),
         'extract_transform_function_name': getenv('EXTRACT_TRANFORM_FUNC_NAME'),
         'load_function_name': getenv('LOAD_FUNC_NAME'),
-        'dataset_id': getenv('DATASET_ID')
+        'dataset_id': getenv('DATASET_ID'),
+        # optional job arguments, space separated key=value pairs (ex: "schema_validation=strict")
+        'job_options': getenv('JOB_OPTIONS', ''),
+        # ephemeral: the cluster is deleted after each run, reuse: it is deleted after being idle for cluster_idle_ttl seconds
+        'cluster_mode': getenv('CLUSTER_MODE', 'ephemeral'),
+        'cluster_idle_ttl': int(getenv('CLUSTER_IDLE_TTL', '1800')),
+        # cluster: dataproc cluster job, serverless: dataproc batch, local: spark-submit subprocess (testing)
+        'execution_backend': getenv('EXECUTION_BACKEND', 'cluster'),
+        'serverless_runtime_version': getenv('SERVERLESS_RUNTIME_VERSION', '2.1'),
+        'local_job_path': getenv('LOCAL_JOB_PATH', path.join(path.dirname(__file__), '..', 'job', 'job.py')),
+        # size the cluster and the spark settings from the input
+        'auto_sizing': getenv('AUTO_SIZING', 'true') == 'true',
+        # seconds to wait for all the BigQuery load jobs
+        'bigquery_load_timeout': int(getenv('BIGQUERY_LOAD_TIMEOUT', '300')),
+        # truncate: each load rewrites the tables, merge: partitioned and clustered tables updated from staging tables
+        'bigquery_write_mode': getenv('BIGQUERY_WRITE_MODE', 'truncate'),
+        # skip the runs whose source file, job code and options were already loaded
+        'result_cache': getenv('RESULT_CACHE', 'true') == 'true',
+        # connector used by the job bigquery sink (job option sink=bigquery) on the cluster
+        'bigquery_connector_jar': getenv('BIGQUERY_CONNECTOR_JAR',
+                                         'gs://spark-lib/bigquery/spark-bigquery-with-dependencies_2.12-0.32.2.jar'),
+        # job watchdog, disabled without topic
+        'watchdog_topic_name': getenv('WATCHDOG_TOPIC'),
+        'max_job_retries': int(getenv('MAX_JOB_RETRIES', '1')),
+        'job_stall_timeout': int(getenv('JOB_STALL_TIMEOUT', '900')),
+        'max_job_duration': int(getenv('MAX_JOB_DURATION', '10800')),
+        'watchdog_poll_budget': int(getenv('WATCHDOG_POLL_BUDGET', '300'))
     }
     print(config)
     return config
@@ -41,6 +152,7 @@ def get_cluster_config(config:dict) -> dict:
         dict: dataproc cluster configuration
     """
     project_id, cluster_name = config['project_id'], config['cluster_name']
+    size = config.get('cluster_size', get_cluster_size(DEFAULT_CLUSTER_SIZE_INDEX))
     # Create the cluster config with 30GB memory for both master and worker nodes.
     cluster_config = {
         "project_id": project_id,
@@ -55,18 +167,49 @@ def get_cluster_config(config:dict) -> dict:
                 }
             },
             "worker_config": {
-                "num_instances": 2,
-                "machine_type_uri": "n1-standard-4",
+                "num_instances": size['workers'],
+                "machine_type_uri": size['machine_type'],
                 "disk_config": {
-                    "boot_disk_size_gb":40
+                    "boot_disk_size_gb": size['disk_gb']
                 }
             }
         },
     }
+    if size['workers'] == 0:
+        # single node cluster, the master runs the executors
+        cluster_config['config']['software_config']['properties'] = {"dataproc:dataproc.allow.zero.workers": "true"}
+    if config['cluster_mode'] == 'reuse':
+        # Dataproc deletes the cluster once no job ran on it for the idle ttl
+        cluster_config['config']['lifecycle_config'] = {
+            "idle_delete_ttl": {"seconds": config['cluster_idle_ttl']}
+        }
 
     print(f'Creating cluster configuration: {cluster_config}.')
     return cluster_config
 
+def get_job_args(config:dict)->list:
+    """Return the arguments of the processing job, whatever the backend running it.
+    The submission time and the backend are sent to measure the job startup latency.
+
+    Args:
+        config (dict): main configuration dict
+
+    Returns:
+        list: job arguments
+    """
+    data_bucket_name = config['data_bucket_name']
+    data_file_name   = config['data_file_name']
+    project_id       = config['project_id']
+    topic_name       = config['load_topic_name']
+    job_options      = config['job_options'].split()
+
+    return [data_bucket_name, data_file_name, project_id, topic_name] + job_options + [
+        f"backend={config['execution_backend']}",
+        f"submitted_at={time.time()}",
+        f"bigquery_dataset={project_id}.{config['dataset_id']}",
+        f"result_key={config.get('result_key', '')}"
+    ]
+
 def get_job_config(config:dict)->dict:
     """Return the dataproc cluster job configuration.
 
@@ -79,21 +222,141 @@ def get_job_config(config:dict)->dict:
     cluster_name     = config['cluster_name']
     job_bucket_name  = config['job_bucket_name']
     job_file_name    = config['job_file_name']
-    data_bucket_name = config['data_bucket_name']
-    data_file_name   = config['data_file_name']
-    project_id       = config['project_id']
-    topic_name       = config['load_topic_name']
+    job_options      = config['job_options'].split()
+    bigquery_connector_jar = config['bigquery_connector_jar']
 
     print('Creating job Config.')
     config = {
         "placement": {"cluster_name": cluster_name},
         "pyspark_job": {
             "main_python_file_uri": f"gs://{job_bucket_name}/{job_file_name}",
-            "args": [data_bucket_name, data_file_name, project_id, topic_name]
+            "args": get_job_args(config),
+            "properties": config.get('spark_properties', {})
             }
     }
+    if 'sink=bigquery' in job_options:
+        config['pyspark_job']['jar_file_uris'] = [bigquery_connector_jar]
     return config
 
+def get_batch_config(config:dict)->dict:
+    """Return the dataproc serverless batch configuration, running the same job as the cluster.
+
+    Args:
+        config (dict): main configuration dict
+
+    Returns:
+        dict: dataproc batch configuration
+    """
+    job_bucket_name  = config['job_bucket_name']
+    job_file_name    = config['job_file_name']
+
+    print('Creating batch Config.')
+    return {
+        "pyspark_batch": {
+            "main_python_file_uri": f"gs://{job_bucket_name}/{job_file_name}",
+            "args": get_job_args(config)
+        },
+        "runtime_config": {
+            "version": config['serverless_runtime_version'],
+            "properties": config.get('spark_properties', {})
+        }
+    }
+
+def get_input_size(bucket_client, config:dict)->int:
+    """Return the uncompressed size of the input data, estimated from the zip file if it is not unzipped.
+
+    Args:
+        bucket_client (): bucket client
+        config (dict): main configuration dict
+
+    Returns:
+        int: input bytes, 0 if no input file is found
+    """
+    data_file_name = config['data_file_name']
+    blob = bucket_client.get_blob(data_file_name)
+    if blob is not None:
+        return blob.size
+    zip_blob = bucket_client.get_blob(f'{data_file_name}.zip')
+    if zip_blob is not None:
+        return zip_blob.size * ZIP_COMPRESSION_RATIO
+    return 0
+
+def get_previous_run_metrics(bucket_client)->dict:
+    """Return the metrics saved by the last job run.
+
+    Args:
+        bucket_client (): bucket client
+
+    Returns:
+        dict: run metrics or {} if there is none
+    """
+    blobs = sorted(bucket_client.list_blobs(prefix=f'{RUN_METRICS_PREFIX}/'), key=lambda blob: blob.name)
+    if not blobs:
+        return {}
+    try:
+        return json.loads(blobs[-1].download_as_text())
+    except Exception as e:
+        print(f'Failed to read the previous run metrics. Error: {e}')
+        return {}
+
+def get_cluster_size(index:int)->dict:
+    """Return a cluster size of the CLUSTER_SIZES table.
+
+    Args:
+        index (int): size index, the largest size is used above the table
+
+    Returns:
+        dict: workers, machine_type, vcpus, disk_gb
+    """
+    _, workers, machine_type, vcpus, disk_gb = CLUSTER_SIZES[min(index, len(CLUSTER_SIZES) - 1)]
+    return {'workers': workers, 'machine_type': machine_type, 'vcpus': vcpus, 'disk_gb': disk_gb}
+
+def size_job(bucket_client, config:dict, min_size_index:int=0)->None:
+    """Choose the cluster size and the spark settings from the input size and the previous run metrics.
+    The result is stored in the config ('cluster_size', 'cluster_size_index' and 'spark_properties').
+
+    Args:
+        bucket_client (): bucket client
+        config (dict): main configuration dict
+        min_size_index (int, optional): smallest cluster size allowed (retries). Defaults to 0.
+    """
+    input_bytes = get_input_size(bucket_client, config)
+    size_index = next(index for index, size in enumerate(CLUSTER_SIZES) if size[0] is None or input_bytes <= size[0])
+    size_index = min(max(size_index, min_size_index), len(CLUSTER_SIZES) - 1)
+    size = get_cluster_size(size_index)
+    cores = max(size['workers'], 1) * size['vcpus']
+
+    # the largest shuffle of the previous run, or an estimate from the input size
+    stages = get_previous_run_metrics(bucket_client).get('stages', [])
+    shuffle_bytes = max([stage.get('shuffleWriteBytes', 0) for stage in stages] + [0])
+    if not shuffle_bytes:
+        shuffle_bytes = input_bytes * SHUFFLE_BYTES_PER_INPUT_BYTE
+
+    # at least 2 tasks per core, the adaptive execution merges the small shuffle partitions
+    shuffle_partitions = max(2 * cores, math.ceil(shuffle_bytes / SHUFFLE_PARTITION_BYTES))
+    split_bytes = min(MAX_SPLIT_BYTES, max(MIN_SPLIT_BYTES, input_bytes // (2 * cores)))
+
+    config['cluster_size'] = size
+    config['cluster_size_index'] = size_index
+    config['spark_properties'] = {
+        'spark.sql.adaptive.enabled': 'true',
+        'spark.sql.adaptive.coalescePartitions.enabled': 'true',
+        'spark.sql.adaptive.skewJoin.enabled': 'true',
+        'spark.sql.shuffle.partitions': str(shuffle_partitions),
+        'spark.sql.files.maxPartitionBytes': str(split_bytes)
+    }
+    print(f"Sized the job for {input_bytes} input bytes: {config['cluster_size']}, {config['spark_properties']}")
+
+def get_bigquery_copy_job_config()->bigquery.CopyJobConfig:
+    """Return the Big Query copy job configuration used to swap a staging table into its final table.
+
+    Returns:
+        bigquery.CopyJobConfig: configuration
+    """
+    return bigquery.CopyJobConfig(
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE, # rewrite the table
+    )
+
 def get_bigquery_job_config()->bigquery.LoadJobConfig:
     """Return a basic Big Query job configuration. The job erases the previous table. the inserted data come from a parquet file.
 
@@ -106,6 +369,47 @@ def get_bigquery_job_config()->bigquery.LoadJobConfig:
     )
 
 # Clients
+# Created on first use and reused by the next invocations of a warm function instance
+CLIENTS = {}
+INVOCATIONS = {}
+
+def get_client(key:str, factory):
+    """Return the client registered under a key, creating it on first use.
+
+    Args:
+        key (str): client key, including the settings it is created with
+        factory (): function creating the client
+
+    Returns:
+        (): client
+    """
+    if key not in CLIENTS:
+        start = time.perf_counter()
+        CLIENTS[key] = factory()
+        print(f"Client '{key}' created in {time.perf_counter() - start:.3f}s.")
+    else:
+        print(f"Reusing client '{key}'.")
+    return CLIENTS[key]
+
+def log_invocation(function_name:str)->None:
+    """Print whether the function runs on a cold or a warm instance (clients already created).
+
+    Args:
+        function_name (str): entry point name
+    """
+    INVOCATIONS[function_name] = INVOCATIONS.get(function_name, 0) + 1
+    state = 'cold' if sum(INVOCATIONS.values()) == 1 else 'warm'
+    print(f"'{function_name}' invocation n°{INVOCATIONS[function_name]} on a {state} instance, {len(CLIENTS)} clients ready.")
+
+def set_client(key:str, client)->None:
+    """Register a client, used to inject fakes in tests.
+
+    Args:
+        key (str): client key
+        client (): client
+    """
+    CLIENTS[key] = client
+
 def create_cluster_client(config:dict)->dataproc.ClusterControllerClient:
     """Create a dataproc cluster client.
 
@@ -116,10 +420,9 @@ def create_cluster_client(config:dict)->dataproc.ClusterControllerClient:
         dataproc.ClusterControllerClient: cluster controller client
     """
     region = config['region']
-    print('Creating a ClusterControllerClient.')
-    return dataproc.ClusterControllerClient(
+    return get_client(f'cluster:{region}', lambda: dataproc.ClusterControllerClient(
         client_options={"api_endpoint": f"{region}-dataproc.googleapis.com:443"}
-    )
+    ))
 
 def create_job_client(config:dict)->dataproc.JobControllerClient:
     """Create a cluster job client.
@@ -131,10 +434,23 @@ def create_job_client(config:dict)->dataproc.JobControllerClient:
         dataproc.JobControllerClient: job controller client
     """
     region = config['region']
-    print('Creating a JobControllerClient')
-    return dataproc.JobControllerClient(
+    return get_client(f'job:{region}', lambda: dataproc.JobControllerClient(
         client_options={"api_endpoint": f"{region}-dataproc.googleapis.com:443"}
-        )
+        ))
+
+def create_batch_client(config:dict)->dataproc.BatchControllerClient:
+    """Create a dataproc serverless batch client.
+
+    Args:
+        config (dict): main configuration dict
+
+    Returns:
+        dataproc.BatchControllerClient: batch controller client
+    """
+    region = config['region']
+    return get_client(f'batch:{region}', lambda: dataproc.BatchControllerClient(
+        client_options={"api_endpoint": f"{region}-dataproc.googleapis.com:443"}
+        ))
 
 def create_bucket_client(config:dict)->storage.Client:
     """Create a Google Cloud Storage bucket client.
@@ -147,10 +463,21 @@ def create_bucket_client(config:dict)->storage.Client:
     """
     project = config['project_id']
     bucket_name = config['data_bucket_name']
-    storage_client = storage.Client(project=project)
+    storage_client = create_storage_client(project)
     bucket_client = storage.Bucket(storage_client, bucket_name)
     return bucket_client
 
+def create_storage_client(project:str=None)->storage.Client:
+    """Create a Google Cloud Storage client.
+
+    Args:
+        project (str, optional): project id. Defaults to None (project of the environment).
+
+    Returns:
+        storage.Client: Google Cloud Storage client
+    """
+    return get_client(f'storage:{project}', lambda: storage.Client(project=project))
+
 def create_biquery_client(config:dict)->bigquery.client:
     """Create a big Query client.
 
@@ -161,15 +488,22 @@ def create_biquery_client(config:dict)->bigquery.client:
         bigquery.client: Big Query client
     """
     project = config['project_id']
-    client = bigquery.Client(project=project)
-    return client
+    return get_client(f'bigquery:{project}', lambda: bigquery.Client(project=project))
+
+def create_publisher_client()->pubsub.PublisherClient:
+    """Create a Pub Sub publisher client.
+
+    Returns:
+        pubsub.PublisherClient: publisher client
+    """
+    return get_client('publisher', lambda: pubsub.PublisherClient())
 
 # Dataproc control
-def cluster_exists(cluster_client:dataproc.ClusterControllerClient,
-                   project_id:str,
-                   region:str,
-                   cluster_name:str)->bool:
-    """Check if a cluster exist.
+def get_cluster_state(cluster_client:dataproc.ClusterControllerClient,
+                      project_id:str,
+                      region:str,
+                      cluster_name:str)->str:
+    """Return the state of a cluster.
 
     Args:
         cluster_client (dataproc.ClusterControllerClient): cluster controller client
@@ -178,30 +512,60 @@ def cluster_exists(cluster_client:dataproc.ClusterControllerClient,
         cluster_name (str): cluster name
 
     Returns:
-        bool: _description_
+        str: cluster state (RUNNING, CREATING, DELETING, ERROR ...), "" if the cluster does not exist
     """
     print('Checking if the cluster exist or not.')
     try:
         # Attempt to get information about the cluster
-        cluster_client.get_cluster(
+        cluster = cluster_client.get_cluster(
             project_id=project_id,
             region=region,
             cluster_name=cluster_name
         )
-        return True  # Cluster exists
+        return cluster.status.state.name
     except Exception as e:
         print(f'Cluster not found: {e}.')
-        return False # Cluster doesn't exist
+        return "" # Cluster doesn't exist
+
+def wait_for_cluster(cluster_client:dataproc.ClusterControllerClient, config:dict, sleep=time.sleep)->str:
+    """Wait for a cluster being created or deleted (idle TTL) to be ready or gone.
+    A cluster in error or stopped is deleted.
+
+    Args:
+        cluster_client (dataproc.ClusterControllerClient): cluster controller client
+        config (dict): main configuration dict
+        sleep (, optional): sleep function. Defaults to time.sleep.
+
+    Returns:
+        str: ready cluster state, "" if there is no cluster to use
+    """
+    project_id   = config['project_id']
+    region       = config['region']
+    cluster_name = config['cluster_name']
+    deadline     = time.monotonic() + CLUSTER_WAIT_TIMEOUT
+    while True:
+        state = get_cluster_state(cluster_client, project_id, region, cluster_name)
+        print(f"Cluster '{cluster_name}' state: {state or 'NOT FOUND'}.")
+        if state == "" or state in CLUSTER_READY_STATES:
+            return state
+        if state not in CLUSTER_PENDING_STATES:
+            # ERROR, STOPPED ...: the cluster can not run jobs
+            if not delete_dataproc_cluster(cluster_client, config):
+                raise RuntimeError(f"Cluster '{cluster_name}' is {state} and could not be deleted.")
+            continue
+        if time.monotonic() + CLUSTER_POLL_DELAY > deadline:
+            raise TimeoutError(f"Cluster '{cluster_name}' still {state} after {CLUSTER_WAIT_TIMEOUT}s.")
+        sleep(CLUSTER_POLL_DELAY)
 
 def create_dataproc_cluster(cluster_client, config:dict)->bool:
-    """Create a dataproc cluster.
+    """Create a dataproc cluster, or wait for the existing one to be ready.
 
     Args:
         cluster_client (dataproc.ClusterControllerClient): cluster controller client
         config (dict): main configuration dict
 
     Returns:
-        bool: _description_
+        bool: True if the cluster is ready
     """
     project_id       = config['project_id']
     region           = config['region']
@@ -209,12 +573,12 @@ def create_dataproc_cluster(cluster_client, config:dict)->bool:
 
     print('Starting dataproc cluster creation precedure.')
 
-    # Check if the cluster already exists
-    if cluster_exists(cluster_client, project_id, region, cluster_name):
-        print(f"Cluster '{cluster_name}' already exists. Skipping creation.")
-        return True
-    print(f"Cluster '{cluster_name}' does not exists. Starting creation.")
     try:
+        # Check if the cluster already exists
+        if wait_for_cluster(cluster_client, config):
+            print(f"Cluster '{cluster_name}' already exists. Skipping creation.")
+            return True
+        print(f"Cluster '{cluster_name}' does not exists. Starting creation.")
         # Create the cluster config with 50GB memory for both master and worker nodes.
         cluster = get_cluster_config(config)
 
@@ -296,6 +660,297 @@ def submit_job_to_cluster(job_client:dataproc.JobControllerClient, config:dict)-
         print(f"Failed to submit the job. Error: {e}")
         return False
 
+def submit_batch(batch_client:dataproc.BatchControllerClient, config:dict)->bool:
+    """Submit the job as a dataproc serverless batch, no cluster is needed.
+
+    Args:
+        batch_client (dataproc.BatchControllerClient): batch controller client
+        config (dict): main configuration dict
+
+    Returns:
+        bool: True if submitted, False if an error occured
+    """
+    project_id       = config['project_id']
+    region           = config['region']
+    # batch ids: 4 to 63 lowercase letters, digits and hyphens, unique per project and region
+    batch_id         = f"{config['cluster_name']}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    print('Starting submitting batch procedure.')
+    try:
+        batch = get_batch_config(config)
+
+        print('Submitting batch.')
+        # the operation ends with the batch, it is not waited for
+        batch_client.create_batch(
+            request={"parent": f"projects/{project_id}/locations/{region}", "batch": batch, "batch_id": batch_id}
+        )
+
+        config['batch_id'] = batch_id
+        print(f'Submitted batch ID "{batch_id}".')
+        return True
+    except Exception as e:
+        print(f"Failed to submit the batch. Error: {e}")
+        return False
+
+def get_batch_name(config:dict)->str:
+    """Return the resource name of the submitted batch.
+
+    Args:
+        config (dict): main configuration dict
+
+    Returns:
+        str: batch resource name
+    """
+    return f"projects/{config['project_id']}/locations/{config['region']}/batches/{config['batch_id']}"
+
+def get_batch_state(batch_client:dataproc.BatchControllerClient, config:dict)->str:
+    """Return the state of the submitted batch.
+
+    Args:
+        batch_client (dataproc.BatchControllerClient): batch controller client
+        config (dict): main configuration dict
+
+    Returns:
+        str: batch state (PENDING, RUNNING, SUCCEEDED, FAILED, ...) or "" if an error occured
+    """
+    try:
+        batch = batch_client.get_batch(name=get_batch_name(config))
+        return batch.state.name
+    except Exception as e:
+        print(f"Failed to get the batch state. Error: {e}")
+        return ""
+
+def cancel_batch(batch_client:dataproc.BatchControllerClient, config:dict)->bool:
+    """Cancel the submitted batch, through the operation that runs it.
+
+    Args:
+        batch_client (dataproc.BatchControllerClient): batch controller client
+        config (dict): main configuration dict
+
+    Returns:
+        bool: True if cancelled, False if an error occured
+    """
+    try:
+        batch = batch_client.get_batch(name=get_batch_name(config))
+        batch_client.cancel_operation(request={"name": batch.operation})
+        print(f'Batch "{config["batch_id"]}" cancelled.')
+        return True
+    except Exception as e:
+        print(f"Failed to cancel the batch. Error: {e}")
+        return False
+
+def submit_local_job(config:dict)->bool:
+    """Run the job with a local spark-submit subprocess, a stand-in backend for testing.
+
+    Args:
+        config (dict): main configuration dict
+
+    Returns:
+        bool: True if started, False if an error occured
+    """
+    print('Starting local job procedure.')
+    try:
+        spark_conf = [arg for key, value in config.get('spark_properties', {}).items() for arg in ('--conf', f'{key}={value}')]
+        process = subprocess.Popen(['spark-submit'] + spark_conf + [config['local_job_path']] + get_job_args(config))
+        config['job_id'] = f'local-{process.pid}'
+        print(f'Started local job "{config["job_id"]}".')
+        return True
+    except Exception as e:
+        print(f"Failed to start the local job. Error: {e}")
+        return False
+
+def get_active_job_id(job_client:dataproc.JobControllerClient, config:dict)->str:
+    """Return the id of a job pending or running on the cluster.
+
+    Args:
+        job_client (dataproc.JobControllerClient): job controller client
+        config (dict): main configuration dict
+
+    Returns:
+        str: active job id or "" if there is none
+    """
+    try:
+        jobs = job_client.list_jobs(request={
+            "project_id": config['project_id'],
+            "region": config['region'],
+            "cluster_name": config['cluster_name'],
+            "job_state_matcher": dataproc.ListJobsRequest.JobStateMatcher.ACTIVE
+        })
+        for job in jobs:
+            return job.reference.job_id
+    except Exception as e:
+        print(f'Failed to list the active jobs. Error: {e}')
+    return ""
+
+def cleanup_cluster(cluster_client:dataproc.ClusterControllerClient, config:dict)->bool:
+    """Delete the cluster at the end of a run, unless it is kept warm for the next runs.
+
+    Args:
+        cluster_client (dataproc.ClusterControllerClient): cluster controller client
+        config (dict): main configuration dict
+
+    Returns:
+        bool: True if the cluster is deleted or kept on purpose, False if an error occured
+    """
+    if config['execution_backend'] != 'cluster':
+        print(f"No cluster to delete with the {config['execution_backend']} backend.")
+        return True
+    if config['cluster_mode'] == 'reuse':
+        print(f"Keeping cluster '{config['cluster_name']}' warm, "
+              f"it is deleted after {config['cluster_idle_ttl']}s without jobs.")
+        return True
+    return delete_dataproc_cluster(cluster_client, config)
+
+# Job watchdog
+def arm_watchdog(config:dict, attempt:int)->None:
+    """Ask the watch_job function to follow the submitted job.
+
+    Args:
+        config (dict): main configuration dict
+        attempt (int): attempt number of the job, 0 for the first submission
+    """
+    if not config['watchdog_topic_name']:
+        return
+    watch = {'job_id': config.get('job_id', ''),
+             'batch_id': config.get('batch_id', ''),
+             'attempt': attempt,
+             'size_index': config.get('cluster_size_index', DEFAULT_CLUSTER_SIZE_INDEX),
+             'submitted_at': time.time()}
+    publish_message_in_topic(config['project_id'], config['watchdog_topic_name'], json.dumps(watch))
+
+def get_job_state(job_client:dataproc.JobControllerClient, config:dict)->str:
+    """Return the state of the followed job, a serverless batch state is translated to the job one.
+
+    Args:
+        job_client (dataproc.JobControllerClient): job controller client, the batch client for a batch
+        config (dict): main configuration dict
+
+    Returns:
+        str: job state (PENDING, RUNNING, DONE, ERROR, ...) or UNKNOWN if an error occured
+    """
+    if config.get('batch_id'):
+        return BATCH_JOB_STATES.get(get_batch_state(job_client, config), 'UNKNOWN')
+    try:
+        job = job_client.get_job(project_id=config['project_id'], region=config['region'], job_id=config['job_id'])
+        return job.status.state.name
+    except Exception as e:
+        print(f'Failed to get the job state. Error: {e}')
+        return 'UNKNOWN'
+
+def poll_job_state(job_client:dataproc.JobControllerClient,
+                   config:dict,
+                   submitted_at:float,
+                   sleep=time.sleep,
+                   clock=time.time)->str:
+    """Poll the state of the job with an exponential backoff until it ends, stalls or the poll budget is spent.
+
+    Args:
+        job_client (dataproc.JobControllerClient): job controller client, the batch client for a batch
+        config (dict): main configuration dict
+        submitted_at (float): job submission unix time
+        sleep (, optional): sleep function. Defaults to time.sleep.
+        clock (, optional): unix time function. Defaults to time.time.
+
+    Returns:
+        str: DONE, ERROR, CANCELLED, STALLED (waiting or running for too long) or ACTIVE (still running)
+    """
+    job_id     = config.get('batch_id') or config['job_id']
+    deadline   = clock() + config['watchdog_poll_budget']
+    delay      = WATCHDOG_FIRST_DELAY
+    while True:
+        state = get_job_state(job_client, config)
+        elapsed = clock() - submitted_at
+        print(f'Job "{job_id}" is {state} after {elapsed:.0f}s.')
+
+        if state in JOB_TERMINAL_STATES:
+            return state
+        if state in JOB_WAITING_STATES and elapsed > config['job_stall_timeout']:
+            return 'STALLED'
+        if elapsed > config['max_job_duration']:
+            return 'STALLED'
+        if clock() + delay > deadline:
+            return 'ACTIVE'
+        sleep(delay)
+        delay = min(delay * 2, WATCHDOG_MAX_DELAY)
+
+def handle_job_failure(cluster_client:dataproc.ClusterControllerClient,
+                       job_client:dataproc.JobControllerClient,
+                       config:dict,
+                       watch:dict,
+                       state:str,
+                       published:bool=False)->bool:
+    """Clean up after a failed or stalled job, then retry it on a larger cluster if retries are left.
+    The retry goes through the extract_transform function, the cluster creation does not fit in this one.
+    A job that published its completion message before failing is not retried, the load function got its tables.
+
+    Args:
+        cluster_client (dataproc.ClusterControllerClient): cluster controller client
+        job_client (dataproc.JobControllerClient): job controller client, the batch client for a batch
+        config (dict): main configuration dict
+        watch (dict): watchdog message
+        state (str): job state
+        published (bool, optional): the job published its completion message. Defaults to False.
+
+    Returns:
+        bool: True if a retry is requested
+    """
+    if state == 'STALLED' and config.get('batch_id'):
+        cancel_batch(job_client, config)
+    elif state == 'STALLED':
+        try:
+            job_client.cancel_job(project_id=config['project_id'], region=config['region'], job_id=config['job_id'])
+            print(f'Job "{config["job_id"]}" cancelled.')
+        except Exception as e:
+            print(f'Failed to cancel the job. Error: {e}')
+    if published:
+        print(f'Job {state} after publishing its completion message, cleaning up without retrying.')
+        cleanup_cluster(cluster_client, config)
+        return False
+    # the job did not reach the load function, nothing else deletes the cluster
+    if config['execution_backend'] == 'cluster':
+        delete_dataproc_cluster(cluster_client, config)
+
+    if watch['attempt'] >= config['max_job_retries']:
+        print(f"Job {state} after {watch['attempt'] + 1} attempts, giving up.")
+        return False
+    retry = {'attempt': watch['attempt'] + 1, 'size_index': watch['size_index'] + 1}
+    print(f'Job {state}, retrying on a larger cluster: {retry}.')
+    publish_message_in_topic(config['project_id'], config['extract_transform_topic_name'], json.dumps(retry))
+    return True
+
+def job_published(bucket_client, submitted_at:float)->bool:
+    """Check that the job published its completion message, from the marker it writes after publishing.
+
+    Args:
+        bucket_client (): bucket client
+        submitted_at (float): job submission unix time
+
+    Returns:
+        bool: True if the marker was written after the job submission
+    """
+    try:
+        blob = bucket_client.get_blob(COMPLETION_MARKER_NAME)
+        if blob is None:
+            return False
+        return json.loads(blob.download_as_text())['published_at'] >= submitted_at
+    except Exception as e:
+        print(f'Failed to read the job completion marker. Error: {e}')
+        return False
+
+def get_retry_request(event)->dict:
+    """Extract the retry request sent by the watchdog to extract_transform.
+
+    Args:
+        event (): event object
+
+    Returns:
+        dict: attempt and size_index, {} for a first run
+    """
+    try:
+        retry = json.loads(base64.b64decode(event['data']))
+        return retry if isinstance(retry, dict) else {}
+    except Exception:
+        return {}
+
 # Generate log links
 def get_cloud_function_logs_link(config:dict, function_name:str)->str:
     """Create the link to access the logs of a function.
@@ -326,6 +981,10 @@ def get_job_logs_link(config:dict)->str:
     project_id = config['project_id']
     cluster_name = config['cluster_name']
 
+    if config.get('batch_id'):
+        batch_id = config['batch_id']
+        url = f'https://console.cloud.google.com/dataproc/batches/{region}/{batch_id}/monitoring?hl=fr&project={project_id}'
+        return url
     if config['job_id']:
         job_id = config['job_id']
         url = f'https://console.cloud.google.com/dataproc/jobs/{job_id}/monitoring?region={region}&hl=fr&project={project_id}'
@@ -344,8 +1003,7 @@ def publish_message_in_topic(project_id:str, topic:str, message:str)->None:
         topic (str): topic name
         message (str): message
     """
-    print(f"Creating a publisher client for topic '{topic}'.")
-    publisher = pubsub.PublisherClient()
+    publisher = create_publisher_client()
     topic_path = publisher.topic_path(project_id, topic)
     message_data = message
 
@@ -355,6 +1013,8 @@ def publish_message_in_topic(project_id:str, topic:str, message:str)->None:
 
 def response_to_dict(event=None)->dict:
     """Extracts the dict sent by the job via the pubsub.
+    The message encoding is given by its attributes: json, gzip compressed json or
+    a manifest object in GCS. Messages without attributes are python literals (previous jobs).
 
     Args:
         event (, optional): event object. Defaults to None.
@@ -363,37 +1023,78 @@ def response_to_dict(event=None)->dict:
         dict: job dict
     """
     # loading the triger message
-    pubsub_message = base64.b64decode(event['data']).decode('utf-8')
-    # turing it into a dict
-    content = literal_eval(pubsub_message)
+    data = base64.b64decode(event['data'])
+    attributes = event.get('attributes') or {}
+    encoding = attributes.get('encoding')
+    if encoding is None:
+        content = literal_eval(data.decode('utf-8'))
+        print(f'Received : {content}')
+        return content
+
+    if encoding == 'manifest':
+        manifest_uri = json.loads(data)['manifest']
+        print(f'Reading the message manifest {manifest_uri}')
+        data = storage.Blob.from_string(manifest_uri, client=create_storage_client()).download_as_bytes()
+        encoding = 'gzip' if manifest_uri.endswith('.gz') else 'json'
+    if encoding == 'gzip':
+        data = gzip.decompress(data)
+    content = json.loads(data)
+
+    if content.get('schema_version') != MESSAGE_SCHEMA_VERSION:
+        print(f"Unexpected message schema version: {content.get('schema_version')}")
     print(f'Received : {content}')
     return content
 
+def print_job_metrics(response:dict)->None:
+    """Print the per stage metrics sent by the job.
+
+    Args:
+        response (dict): job dict
+    """
+    metrics = response.get('metrics')
+    if not metrics:
+        return
+    print(f"Backend: {metrics.get('backend')}, startup latency: {metrics.get('startup_latency_s')}s, "
+          f"job duration: {metrics.get('job_duration_s')}s, run report: {metrics.get('report_path')}")
+    for stage in metrics.get('stages', []):
+        print(f"Stage '{stage['stage']}' ({stage.get('status')}): {stage.get('duration_s')}s, "
+              f"rows: {stage.get('rows', '-')}, output bytes: {stage.get('output_bytes', '-')}, "
+              f"shuffle write bytes: {stage.get('shuffleWriteBytes', '-')}")
+
 # Storage
-def find_parquet_file_in_bucket_dir(bucket_client, folder_name:str)->str:
-    """Search for a parquet file inside a folder in a bucket.
+def is_output_complete(bucket_client, folder_name:str)->bool:
+    """Check if the job finished writing a folder (Spark writes a _SUCCESS marker at the end).
 
     Args:
         bucket_client (): bucket client
         folder_name (str): folder name
 
     Returns:
-        str: file path or "" if not found
+        bool: True if the folder is complete
     """
-    blobs = bucket_client.list_blobs(prefix=folder_name)
-    file_complete = False
-    parquet_file_name = ""
-    for blob in blobs:
-        if '_SUCCESS' in blob.name:
-            file_complete = True
-        if '.parquet' in blob.name:
-            parquet_file_name = blob.name
-            print(f"parquet file found '{parquet_file_name}'.")
-            return parquet_file_name
+    return bucket_client.blob(f'{folder_name}/_SUCCESS').exists()
 
-    if file_complete and parquet_file_name:
-        return parquet_file_name
-    return ""
+def get_table_source_uris(bucket_client, table:dict, config:dict)->list:
+    """Return the uris of all the parquet files of a table.
+    The files listed by the job are used as is, otherwise the whole folder is loaded with a wildcard.
+
+    Args:
+        bucket_client (): bucket client
+        table (dict): table sent by the job
+        config (dict): main configuration dict
+
+    Returns:
+        list: parquet files uris
+    """
+    bucket_name = config['data_bucket_name']
+    table_name  = table['table_name']
+    if table.get('files'):
+        print(f"{len(table['files'])} parquet files ({sum(file['size'] for file in table['files'])} bytes) for '{table_name}'.")
+        return [get_parquet_file_uri(bucket_name, file['name']) for file in table['files']]
+
+    if not is_output_complete(bucket_client, table_name):
+        raise FileNotFoundError(f"No _SUCCESS marker in gs://{bucket_name}/{table_name}, the output is incomplete.")
+    return [get_parquet_file_uri(bucket_name, f'{table_name}/*.parquet')]
 
 def get_parquet_file_uri(bucket_name:str, file_path:str)->str:
     """Create a GCS file uri.
@@ -407,6 +1108,86 @@ def get_parquet_file_uri(bucket_name:str, file_path:str)->str:
     """
     return f"gs://{bucket_name}/{file_path}"
 
+def get_blob_version(bucket_client, blob_names:list)->str:
+    """Return the version of the first existing blob: its content md5, or its generation without md5.
+
+    Args:
+        bucket_client (): bucket client
+        blob_names (list): blob names, by order of preference
+
+    Returns:
+        str: blob version, "" if no blob is found
+    """
+    for blob_name in blob_names:
+        blob = bucket_client.get_blob(blob_name)
+        if blob is not None:
+            return f'{blob_name}:{blob.md5_hash or blob.generation}'
+    return ""
+
+def get_result_key(config:dict)->str:
+    """Return the content address of the run results. It changes with the source file, the job code,
+    the job options (report parameters) and the current year used by the reports.
+
+    Args:
+        config (dict): main configuration dict
+
+    Returns:
+        str: result key, "" if the source file or the job code is not found
+    """
+    data_file_name = config['data_file_name']
+    source_version = get_blob_version(create_bucket_client(config), [f'{data_file_name}.zip', data_file_name])
+    if config['execution_backend'] == 'local':
+        with open(config['local_job_path'], 'rb') as file:
+            job_version = hashlib.md5(file.read()).hexdigest()
+    else:
+        job_bucket = storage.Bucket(create_storage_client(config['project_id']), config['job_bucket_name'])
+        job_version = get_blob_version(job_bucket, [config['job_file_name']])
+    if not source_version or not job_version:
+        return ""
+
+    key = {'source': source_version,
+           'job': job_version,
+           'job_options': sorted(config['job_options'].split()),
+           'current_year': datetime.now().year,
+           'dataset_id': config['dataset_id'],
+           'bigquery_write_mode': config['bigquery_write_mode'],
+           'message_schema_version': MESSAGE_SCHEMA_VERSION}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+def get_cached_result(bucket_client, result_key:str)->dict:
+    """Return the result cache entry of a run.
+
+    Args:
+        bucket_client (): bucket client
+        result_key (str): result key
+
+    Returns:
+        dict: cache entry, {} if the results were not loaded yet
+    """
+    blob = bucket_client.get_blob(f'{RESULT_CACHE_PREFIX}/{result_key}.json')
+    if blob is None:
+        return {}
+    try:
+        return json.loads(blob.download_as_text())
+    except Exception as e:
+        print(f'Failed to read the result cache entry. Error: {e}')
+        return {}
+
+def save_cached_result(bucket_client, response:dict)->None:
+    """Save the result cache entry of a loaded run.
+
+    Args:
+        bucket_client (): bucket client
+        response (dict): job completion message
+    """
+    entry = {'result_key': response['result_key'],
+             'loaded_at': datetime.utcnow().isoformat(),
+             'tables': [{'table_name': table['table_name'], 'content_hash': table.get('content_hash')}
+                        for table in response['tables']]}
+    blob = bucket_client.blob(f"{RESULT_CACHE_PREFIX}/{response['result_key']}.json")
+    blob.upload_from_string(json.dumps(entry), content_type="application/json")
+    print(f"Result cache entry '{response['result_key']}' saved.")
+
 # Big Query
 def create_table_id(project_id:str, dataset_id:str, table_name:str)->str:
     """Create a bigQuery table id.
@@ -422,34 +1203,252 @@ def create_table_id(project_id:str, dataset_id:str, table_name:str)->str:
     table_id = f"{project_id}.{dataset_id}.{table_name}"
     return table_id
 
-def load_to_bigquery(bucket_client, bigquery_client, tables:dict, config:dict):
+def get_loaded_content_hash(bigquery_client, table_id:str)->str:
+    """Return the content hash of the report loaded in a table.
+
+    Args:
+        bigquery_client (bigquery.Client): Big Query client
+        table_id (str): table id
+
+    Returns:
+        str: content hash, "" if the table does not exist or has none
+    """
+    try:
+        return bigquery_client.get_table(table_id).labels.get(CONTENT_HASH_LABEL, "")
+    except Exception:
+        return ""
+
+def set_loaded_content_hash(bigquery_client, table_id:str, content_hash:str)->None:
+    """Record the content hash of the report loaded in a table as a table label.
+
+    Args:
+        bigquery_client (bigquery.Client): Big Query client
+        table_id (str): table id
+        content_hash (str): content hash
+    """
+    try:
+        table = bigquery_client.get_table(table_id)
+        table.labels = dict(table.labels, **{CONTENT_HASH_LABEL: content_hash})
+        bigquery_client.update_table(table, ['labels'])
+    except Exception as e:
+        print(f"Failed to label the table '{table_id}'. Error: {e}")
+
+def get_staging_table_id(table:dict, config:dict)->str:
+    """Return the staging table of a report: the one written by the job, or the one its parquet files are loaded into.
+
+    Args:
+        table (dict): table sent by the job
+        config (dict): main configuration dict
+
+    Returns:
+        str: staging table id
+    """
+    staging_table = table.get('staging_table')
+    if staging_table:
+        # the job writes dataset.table ids
+        return staging_table if staging_table.count('.') == 2 else f"{config['project_id']}.{staging_table}"
+    return create_table_id(config['project_id'], config['dataset_id'], table['table_name'] + STAGING_TABLE_SUFFIX)
+
+def get_merge_query(table_id:str, staging_table_id:str, column_names:list)->str:
+    """Build the script merging a staging table into its final table, then dropping it.
+    The final table is created on the first run, partitioned by year and clustered on the crime type or location.
+    Only the rows that changed are written, BigQuery rewrites the partitions holding them and not the others.
+
+    Args:
+        table_id (str): final table id
+        staging_table_id (str): staging table id
+        column_names (list): table columns
+
+    Returns:
+        str: sql script
+    """
+    def quote(column:str)->str:
+        return f'`{column}`'
+
+    keys     = [column for column in column_names if column not in MEASURE_COLUMNS]
+    measures = [column for column in column_names if column in MEASURE_COLUMNS]
+    cluster  = [column for column in CLUSTER_COLUMNS if column in column_names]
+
+    layout = ''
+    if PARTITION_COLUMN in column_names:
+        first, last = PARTITION_RANGE
+        layout += f'\nPARTITION BY RANGE_BUCKET({quote(PARTITION_COLUMN)}, GENERATE_ARRAY({first}, {last + 1}, 1))'
+    if cluster:
+        layout += f"\nCLUSTER BY {', '.join(quote(column) for column in cluster)}"
+
+    query = (f'CREATE TABLE IF NOT EXISTS `{table_id}`{layout}\n'
+             f'AS SELECT * FROM `{staging_table_id}` WHERE FALSE;\n'
+             f'MERGE `{table_id}` T USING `{staging_table_id}` S\n'
+             f"ON {' AND '.join(f'T.{quote(key)} IS NOT DISTINCT FROM S.{quote(key)}' for key in keys)}\n")
+    if measures:
+        changed = ' OR '.join(f'T.{quote(measure)} IS DISTINCT FROM S.{quote(measure)}' for measure in measures)
+        updates = ', '.join(f'{quote(measure)} = S.{quote(measure)}' for measure in measures)
+        query += f'WHEN MATCHED AND ({changed}) THEN UPDATE SET {updates}\n'
+    query += ('WHEN NOT MATCHED BY TARGET THEN INSERT ROW\n'
+              'WHEN NOT MATCHED BY SOURCE THEN DELETE;\n'
+              f'DROP TABLE `{staging_table_id}`;')
+    return query
+
+def drop_table_with_other_layout(bigquery_client, table_id:str, column_names:list)->bool:
+    """Drop a final table not partitioned and clustered as the merge write mode expects, e.g. a table written
+    in truncate write mode. CREATE TABLE IF NOT EXISTS keeps the layout of an existing table, the merge
+    then recreates it with the expected one.
+
+    Args:
+        bigquery_client (bigquery.Client): Big Query client
+        table_id (str): final table id
+        column_names (list): table columns
+
+    Returns:
+        bool: True if the table was dropped
+    """
+    try:
+        table = bigquery_client.get_table(table_id)
+    except Exception:
+        return False # created by the merge
+
+    partitioning = table.range_partitioning
+    if PARTITION_COLUMN in column_names:
+        first, last = PARTITION_RANGE
+        expected_partitioning = (PARTITION_COLUMN, first, last + 1, 1)
+    else:
+        expected_partitioning = None
+    actual_partitioning = (partitioning.field, partitioning.range_.start, partitioning.range_.end,
+                           partitioning.range_.interval) if partitioning else None
+    expected_cluster = [column for column in CLUSTER_COLUMNS if column in column_names] or None
+    if actual_partitioning == expected_partitioning and (table.clustering_fields or None) == expected_cluster:
+        return False
+
+    print(f"Table '{table_id}' is partitioned by {actual_partitioning} and clustered by {table.clustering_fields}, "
+          f"expected {expected_partitioning} and {expected_cluster}: dropping it, the merge recreates it.")
+    bigquery_client.delete_table(table_id, not_found_ok=True)
+    return True
+
+def wait_for_bigquery_jobs(bigquery_client, jobs:dict, deadline:float, statuses:dict)->None:
+    """Wait for Big Query jobs within a shared deadline and record their status.
 
+    Args:
+        bigquery_client (bigquery.Client): Big Query client
+        jobs (dict): {table name: load, copy or query job}
+        deadline (float): time.monotonic() deadline
+        statuses (dict): {table name: status}, updated
+    """
+    for table_name, job in jobs.items():
+        try:
+            job.result(timeout=max(deadline - time.monotonic(), 0))
+            statuses[table_name] = 'SUCCESS'
+            if isinstance(job, bigquery.CopyJob):
+                print(f"Swapped '{job.sources[0].table_id}' into '{table_name}'.")
+                bigquery_client.delete_table(job.sources[0], not_found_ok=True)
+            elif isinstance(job, bigquery.QueryJob):
+                print(f"Merged the staging table into '{table_name}', {job.total_bytes_processed} bytes processed.")
+            else:
+                print(f"Loaded {job.output_rows} rows into '{job.destination.table_id}'.")
+        except concurrent.futures.TimeoutError:
+            statuses[table_name] = f'TIMEOUT: still {job.state} at the deadline'
+        except Exception as e:
+            statuses[table_name] = f'FAILED: {e}'
+
+def load_to_bigquery(bucket_client, bigquery_client, tables:dict, config:dict)->bool:
+    """Load the parquet files of the tables into BigQuery.
+    truncate write mode: the tables are rewritten, the ones written directly by the job into a staging table
+    are swapped in with a copy job.
+    merge write mode: the tables are loaded into staging tables, then merged into partitioned and clustered tables.
+    Tables whose content hash matches the one of the loaded table are skipped.
+    All the jobs of a step are started first, then waited for together.
+
+    Args:
+        bucket_client (): bucket client
+        bigquery_client (bigquery.Client): Big Query client
+        tables (dict): tables sent by the job
+        config (dict): main configuration dict
+
+    Returns:
+        bool: True if all the tables are loaded
+    """
     project_id = config['project_id']
     dataset_id = config['dataset_id']
-    bucket_name = config['data_bucket_name']
+    deadline = time.monotonic() + config['bigquery_load_timeout']
+    merge = config['bigquery_write_mode'] == 'merge'
 
     job_config = get_bigquery_job_config()
+    copy_job_config = get_bigquery_copy_job_config()
 
-    # Creating a table for each parquet file
+    # Starting a load or copy job for each table
+    statuses = {}
+    load_jobs = {}
+    staging_tables = {}
+    content_hashes = {}
     for table in tables:
         table_name  = table['table_name']
-        gcs_file_path   = find_parquet_file_in_bucket_dir(bucket_client, table_name)
-        table_id    = create_table_id(project_id, dataset_id, table_name)
-        uri         = get_parquet_file_uri(bucket_name, gcs_file_path)
-
-        # loading parquet table into table
-        load_job = bigquery_client.load_table_from_uri(
-            uri,
-            table_id,
-            job_config=job_config
-        )
-
-        load_job.result()  # Waits for the job to complete.
-
-        destination_table = bigquery_client.get_table(table_id)
-        print("Loaded {} rows.".format(destination_table.num_rows))
-
-    return True
+        if table.get('sink') == 'local':
+            print(f"Table '{table_name}' was written to a local file by the job, nothing to load.")
+            continue
+        try:
+            table_id    = create_table_id(project_id, dataset_id, table_name)
+            content_hash = table.get('content_hash')
+            if content_hash and get_loaded_content_hash(bigquery_client, table_id) == content_hash:
+                print(f"Table '{table_id}' is unchanged, skipping it.")
+                statuses[table_name] = 'UNCHANGED'
+                if table.get('staging_table'):
+                    bigquery_client.delete_table(get_staging_table_id(table, config), not_found_ok=True)
+                continue
+            if content_hash:
+                content_hashes[table_name] = content_hash
+            if merge:
+                staging_tables[table_name] = get_staging_table_id(table, config)
+            if table.get('staging_table'):
+                if merge:
+                    # merged as written by the job
+                    continue
+                # swapping the table written by the job into the final one
+                load_jobs[table_name] = bigquery_client.copy_table(
+                    table['staging_table'],
+                    table_id,
+                    job_config=copy_job_config
+                )
+            else:
+                uris        = get_table_source_uris(bucket_client, table, config)
+                # loading all the parquet files into the table, or into its staging table
+                load_jobs[table_name] = bigquery_client.load_table_from_uri(
+                    uris,
+                    staging_tables.get(table_name, table_id),
+                    job_config=job_config
+                )
+            print(f"Job '{load_jobs[table_name].job_id}' started for table '{table_id}'.")
+        except Exception as e:
+            statuses[table_name] = f'FAILED: {e}'
+
+    # Waiting for all the jobs
+    wait_for_bigquery_jobs(bigquery_client, load_jobs, deadline, statuses)
+
+    # Merging the staging tables
+    if merge:
+        merge_jobs = {}
+        columns = {table['table_name']: table['columns']['names'] for table in tables}
+        for table_name, staging_table_id in staging_tables.items():
+            if statuses.get(table_name, 'SUCCESS') != 'SUCCESS':
+                continue
+            try:
+                table_id = create_table_id(project_id, dataset_id, table_name)
+                drop_table_with_other_layout(bigquery_client, table_id, columns[table_name])
+                query = get_merge_query(table_id, staging_table_id, columns[table_name])
+                merge_jobs[table_name] = bigquery_client.query(query)
+                print(f"Job '{merge_jobs[table_name].job_id}' started to merge '{staging_table_id}'.")
+            except Exception as e:
+                statuses[table_name] = f'FAILED: {e}'
+        wait_for_bigquery_jobs(bigquery_client, merge_jobs, deadline, statuses)
+
+    for table_name, content_hash in content_hashes.items():
+        if statuses.get(table_name) == 'SUCCESS':
+            set_loaded_content_hash(bigquery_client, create_table_id(project_id, dataset_id, table_name), content_hash)
+
+    for table_name, status in statuses.items():
+        print(f"Table '{table_name}': {status}")
+    failed = [table_name for table_name, status in statuses.items() if status not in ('SUCCESS', 'UNCHANGED')]
+    if failed:
+        print(f'{len(failed)}/{len(statuses)} tables not loaded: {failed}')
+    return not failed
 
 # ETL
 def extract_transform(event, context)->str:
@@ -463,12 +1462,46 @@ def extract_transform(event, context)->str:
     Returns:
         str: return
     """
+    log_invocation('extract_transform')
     config         = get_config()
+    retry          = get_retry_request(event) if event else {}
+    attempt        = retry.get('attempt', 0)
+
+    if config['result_cache']:
+        config['result_key'] = get_result_key(config)
+        cached_result = get_cached_result(create_bucket_client(config), config['result_key']) if config['result_key'] else {}
+        if cached_result:
+            print(f"Result cache hit '{config['result_key']}': the tables loaded at {cached_result['loaded_at']} "
+                  f"are up to date, no job to run.")
+            return 'end'
+
+    if config['auto_sizing']:
+        size_job(create_bucket_client(config), config, retry.get('size_index', 0))
+    elif retry:
+        config['cluster_size_index'] = retry['size_index']
+        config['cluster_size'] = get_cluster_size(retry['size_index'])
+
+    if config['execution_backend'] == 'serverless':
+        batch_client = create_batch_client(config)
+        if submit_batch(batch_client, config):
+            arm_watchdog(config, attempt)
+            print(f"See the batch's logs here : {get_job_logs_link(config)}")
+        return 'end'
+    if config['execution_backend'] == 'local':
+        submit_local_job(config)
+        return 'end'
+
     cluster_client = create_cluster_client(config)
     job_client     = create_job_client(config)
 
     if create_dataproc_cluster(cluster_client, config):
-        submit_job_to_cluster(job_client, config)
+        # back to back triggers share the run already going on the cluster
+        active_job_id = get_active_job_id(job_client, config)
+        if active_job_id:
+            config['job_id'] = active_job_id
+            print(f'Job "{active_job_id}" is already running on the cluster, not submitting a new one.')
+        elif submit_job_to_cluster(job_client, config):
+            arm_watchdog(config, attempt)
         print(f"See the job's logs here : {get_job_logs_link(config)}")
 
     return 'end'
@@ -483,6 +1516,7 @@ def load(event, context)->str:
     Returns:
         str: return
     """
+    log_invocation('load')
     # retreiving the content of the pubsub message into a dict
     response = response_to_dict(event)
 
@@ -494,17 +1528,66 @@ def load(event, context)->str:
     bucket_client   = create_bucket_client(config)
     cluster_client  = create_cluster_client(config)
 
+    print_job_metrics(response)
+    for drift in response.get('schema_drifts', []):
+        print(f'Schema drift reported by the job: {drift}')
+
     # tables info
     tables = response['tables']
 
     # If return of Job is succes, load to big query
     if response['status'] == 'SUCCESS':
-        load_to_bigquery(bucket_client, bigquery_client, tables, config)
-        delete_dataproc_cluster(cluster_client, config)
+        loaded = load_to_bigquery(bucket_client, bigquery_client, tables, config)
+        if loaded and response.get('result_key'):
+            save_cached_result(bucket_client, response)
+        cleanup_cluster(cluster_client, config)
+        if not loaded:
+            print('Loading failed, some tables were not loaded.')
+            return 'FAILED'
         print('Loading ended successfully.')
         return ""
-    print('Job failed.')
-    delete_dataproc_cluster(cluster_client, config)
+    print(f"Job failed: {response.get('error', 'see the job logs')}")
+    cleanup_cluster(cluster_client, config)
+    return 'FAILED'
+
+def watch_job(event, context, sleep=time.sleep, clock=time.time)->str:
+    """Google Cloud Function.
+    Follow the job submitted by extract_transform. A job still running when the poll budget is spent
+    is handed over to a new invocation. A failed or stalled job is cleaned up and retried on a larger cluster.
+
+    Args:
+        event (): 
+        context (): 
+        sleep (, optional): sleep function. Defaults to time.sleep.
+        clock (, optional): unix time function. Defaults to time.time.
+
+    Returns:
+        str: return
+    """
+    log_invocation('watch_job')
+    watch = json.loads(base64.b64decode(event['data']))
+    config = get_config()
+    config['job_id'] = watch['job_id']
+    config['batch_id'] = watch.get('batch_id', '')
+
+    # a serverless batch is followed through the batch client
+    job_client = create_batch_client(config) if config['batch_id'] else create_job_client(config)
+    state = poll_job_state(job_client, config, watch['submitted_at'], sleep, clock)
+
+    if state == 'ACTIVE':
+        publish_message_in_topic(config['project_id'], config['watchdog_topic_name'], json.dumps(watch))
+        return ""
+    # a job may fail or look stalled after publishing its completion message: it is not run again
+    published = job_published(create_bucket_client(config), watch['submitted_at'])
+    if state == 'DONE':
+        if published:
+            print(f'Job "{config["batch_id"] or watch["job_id"]}" done, the load function takes over.')
+            return ""
+        # the job exited before publishing (sys.exit, killed driver): load is never triggered
+        print(f'Job "{config["batch_id"] or watch["job_id"]}" done without publishing its completion message, cleaning up.')
+        cleanup_cluster(create_cluster_client(config), config)
+        return ""
+    handle_job_failure(create_cluster_client(config), job_client, config, watch, state, published)
     return ""
 
 def start_processing_pipeline(request)->None:
@@ -515,6 +1598,7 @@ def start_processing_pipeline(request)->None:
         request (): 
 
     """
+    log_invocation('start_processing_pipeline')
     config = get_config()
     project_id = config['project_id']
     topic = config['extract_transform_topic_name']
@@ -0,0 +1,256 @@
+"""Local benchmark of the job transformations on synthetic crimes data.
+
+Runs on a local mode Spark session, the GCS paths are replaced by local directories
+and nothing is sent over the network (the Spark UI api used for the metrics is local).
+
+Usage:
+    python benchmark.py --rows 1000000 10000000 --baseline benchmark_baseline.json
+    python benchmark.py --rows 1000000 --save-baseline
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+import urllib.request
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+
+import job
+
+# Synthetic data shape
+PRIMARY_TYPES = ['THEFT', 'BATTERY', 'CRIMINAL DAMAGE', 'NARCOTICS', 'ASSAULT', 'OTHER OFFENSE',
+                 'BURGLARY', 'MOTOR VEHICLE THEFT', 'DECEPTIVE PRACTICE', 'ROBBERY', 'CRIMINAL TRESPASS',
+                 'WEAPONS VIOLATION', 'PROSTITUTION', 'PUBLIC PEACE VIOLATION', 'OFFENSE INVOLVING CHILDREN',
+                 'CRIM SEXUAL ASSAULT', 'SEX OFFENSE', 'INTERFERENCE WITH PUBLIC OFFICER', 'GAMBLING',
+                 'LIQUOR LAW VIOLATION', 'ARSON', 'HOMICIDE', 'KIDNAPPING', 'STALKING', 'INTIMIDATION']
+LOCATION_DESCRIPTIONS = ['STREET', 'RESIDENCE', 'APARTMENT', 'SIDEWALK', 'OTHER', 'PARKING LOT/GARAGE(NON.RESID.)',
+                         'ALLEY', 'SMALL RETAIL STORE', 'RESTAURANT', 'GROCERY FOOD STORE', 'DEPARTMENT STORE',
+                         'GAS STATION', 'RESIDENTIAL YARD (FRONT/BACK)', 'VEHICLE NON-COMMERCIAL', 'BAR OR TAVERN'] \
+                        + [f'LOCATION {index:03d}' for index in range(150)]
+FIRST_DATE = '2001-01-01 00:00:00'
+LAST_DATE = '2023-12-31 23:59:59'
+
+DEFAULT_WORK_DIR = '/tmp/crimes_benchmark'
+DEFAULT_OUTPUT = 'benchmark_results.json'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+def build_local_spark_session(cores:str, driver_memory:str)->SparkSession:
+    """Build a local mode spark session.
+
+    Args:
+        cores (str): number of local cores, '*' for all
+        driver_memory (str): driver memory (ex: 4g)
+
+    Returns:
+        SparkSession: the spark session object.
+    """
+    return (SparkSession.builder
+            .master(f'local[{cores}]')
+            .appName('CrimesBenchmark')
+            .config('spark.driver.memory', driver_memory)
+            .config('spark.ui.enabled', 'true')
+            .getOrCreate())
+
+def pick(values:list, seed:int):
+    """Return a column picking one of the values at random.
+
+    Args:
+        values (list): values to pick from
+        seed (int): random seed
+
+    Returns:
+        Column: picked value
+    """
+    index = (F.rand(seed) * len(values)).cast('int') + 1
+    return F.element_at(F.array(*[F.lit(value) for value in values]), index)
+
+def generate_crimes_csv(spark_session:SparkSession, rows:int, path:str, seed:int=42)->None:
+    """Write a Chicago crimes shaped csv file (same columns and formats as the source file).
+
+    Args:
+        spark_session (SparkSession): spark session
+        rows (int): number of rows
+        path (str): output directory
+        seed (int, optional): random seed. Defaults to 42.
+    """
+    first = F.unix_timestamp(F.lit(FIRST_DATE))
+    last = F.unix_timestamp(F.lit(LAST_DATE))
+    date = F.from_unixtime(first + (F.rand(seed) * (last - first)).cast('long')).cast('timestamp')
+    latitude = F.round(41.64 + F.rand(seed + 1) * 0.38, 9)
+    longitude = F.round(-87.94 + F.rand(seed + 2) * 0.42, 9)
+
+    def boolean(ratio, offset):
+        return F.when(F.rand(seed + offset) < ratio, 'true').otherwise('false')
+
+    df = spark_session.range(rows).select(
+        (F.col('id') + 1).alias('ID'),
+        F.concat(F.lit('JA'), F.col('id')).alias('Case Number'),
+        F.date_format(date, job.CRIMES_TIMESTAMP_FORMAT).alias('Date'),
+        F.concat((F.rand(seed + 3) * 100).cast('int'), F.lit('XX W MAIN ST')).alias('Block'),
+        F.lpad((F.rand(seed + 4) * 5000).cast('int').cast('string'), 4, '0').alias('IUCR'),
+        pick(PRIMARY_TYPES, seed + 5).alias('Primary Type'),
+        F.lit('SIMPLE').alias('Description'),
+        pick(LOCATION_DESCRIPTIONS, seed + 6).alias('Location Description'),
+        boolean(0.25, 7).alias('Arrest'),
+        boolean(0.15, 8).alias('Domestic'),
+        (F.rand(seed + 9) * 2500).cast('int').alias('Beat'),
+        (F.rand(seed + 10) * 25).cast('int').alias('District'),
+        (F.rand(seed + 11) * 50).cast('int').alias('Ward'),
+        (F.rand(seed + 12) * 77).cast('int').alias('Community Area'),
+        F.lit('06').alias('FBI Code'),
+        (1100000 + F.rand(seed + 13) * 100000).cast('int').alias('X Coordinate'),
+        (1800000 + F.rand(seed + 14) * 150000).cast('int').alias('Y Coordinate'),
+        F.year(date).alias('Year'),
+        F.date_format(date, job.CRIMES_TIMESTAMP_FORMAT).alias('Updated On'),
+        latitude.alias('Latitude'),
+        longitude.alias('Longitude'),
+        F.format_string('(%s, %s)', latitude, longitude).alias('Location'),
+    )
+    df.write.csv(path, header=True, mode='overwrite')
+
+def get_jvm_peak_memory(spark_session:SparkSession)->int:
+    """Return the peak JVM heap memory of the executors (the driver in local mode).
+
+    Args:
+        spark_session (SparkSession): spark session
+
+    Returns:
+        int: peak heap bytes, 0 if not available
+    """
+    spark_context = spark_session.sparkContext
+    url = f'{spark_context.uiWebUrl}/api/v1/applications/{spark_context.applicationId}/executors'
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            executors = json.loads(response.read())
+        return max(executor.get('peakMemoryMetrics', {}).get('JVMHeapMemory', 0) for executor in executors)
+    except Exception as e:
+        print(f'Peak memory not available: {e}')
+        return 0
+
+def force(df)->None:
+    """Compute a dataframe without writing it anywhere.
+
+    Args:
+        df (DataFrame): spark DataFrame
+    """
+    df.write.format('noop').mode('overwrite').save()
+
+def benchmark_scale(spark_session:SparkSession, rows:int, work_dir:str)->list:
+    """Run the job transformations on a synthetic dataset.
+
+    Args:
+        spark_session (SparkSession): spark session
+        rows (int): number of rows
+        work_dir (str): local directory standing for the data bucket
+
+    Returns:
+        list: step metrics
+    """
+    csv_path = os.path.join(work_dir, f'crimes_{rows}.csv')
+    if not os.path.exists(csv_path):
+        print(f'Generating {rows} rows in {csv_path}')
+        generate_crimes_csv(spark_session, rows, csv_path)
+
+    job.STAGE_METRICS.clear()
+    with job.measure_stage('read_csv', spark_session):
+        df_csv = job.pull_gcs_csv_to_df(csv_path, spark_session, 'off')
+        force(df_csv)
+
+    with job.measure_stage('time_columns', spark_session):
+        force(job.add_time_columns(df_csv))
+
+    with job.measure_stage('dimensions', spark_session):
+        dimensions, _ = job.build_dimensions(df_csv, spark_session)
+
+    # the time columns and the codes are stored with the columnar copy, as in the job
+    parquet_path = os.path.join(work_dir, f'ingested_{rows}')
+    with job.measure_stage('ingest', spark_session):
+        job.ingest_df_to_gcs_parquet(job.encode_dimensions(job.add_time_columns(df_csv), dimensions), parquet_path)
+    df_raw = job.pull_gcs_parquet_to_df(parquet_path, spark_session)
+
+    with job.measure_stage('crimes_base', spark_session):
+        df_0 = job.build_crimes_base(df_raw)
+    # fails the benchmark if the time of day is lost again
+    job.check_hour_distribution(df_0)
+
+    with job.measure_stage('reports_aggregate', spark_session):
+        reports_df, reports = job.compile_reports(job.REPORTS, df_0, dimensions, spark_session)
+    for report in reports:
+        with job.measure_stage(report['name'], spark_session):
+            report_df = job.build_report(report, reports_df, dimensions)
+            job.load_df_to_gcs_parquet(report_df, os.path.join(work_dir, f"{report['name']}_{rows}"))
+    reports_df.unpersist()
+    df_0.unpersist()
+
+    steps = [dict(metrics, rows=rows) for metrics in job.STAGE_METRICS]
+    steps.append({'stage': 'peak_memory', 'rows': rows, 'jvm_peak_heap_bytes': get_jvm_peak_memory(spark_session)})
+    return steps
+
+def compare_to_baseline(results:list, baseline:list, tolerance:float)->list:
+    """Compare the step durations with a baseline.
+
+    Args:
+        results (list): step metrics of this run
+        baseline (list): step metrics of the baseline run
+        tolerance (float): slowdown ratio above which a step is a regression
+
+    Returns:
+        list: regressions descriptions
+    """
+    reference = {(step['rows'], step['stage']): step for step in baseline if 'duration_s' in step}
+    regressions = []
+    for step in results:
+        base_step = reference.get((step['rows'], step['stage']))
+        if base_step is None or 'duration_s' not in step or not base_step['duration_s']:
+            continue
+        ratio = step['duration_s'] / base_step['duration_s']
+        print(f"{step['rows']:>10} {step['stage']:<45} {step['duration_s']:>9.3f}s "
+              f"baseline {base_step['duration_s']:>9.3f}s x{ratio:.2f}")
+        if ratio > tolerance:
+            regressions.append(f"{step['stage']} on {step['rows']} rows: x{ratio:.2f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the crimes job transformations locally.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000], help='dataset sizes')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR, help='local stand-in for the data bucket')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='results json file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline json file')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed slowdown ratio')
+    parser.add_argument('--cores', default='*', help='local spark cores')
+    parser.add_argument('--driver-memory', default='4g', help='spark driver memory')
+    parser.add_argument('--clean', action='store_true', help='remove the generated data at the end')
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    spark_session = build_local_spark_session(args.cores, args.driver_memory)
+
+    results = []
+    for rows in args.rows:
+        start = time.perf_counter()
+        results.extend(benchmark_scale(spark_session, rows, args.work_dir))
+        print(f'{rows} rows benchmarked in {time.perf_counter() - start:.1f}s')
+    spark_session.stop()
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results saved in {args.output}')
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f'Baseline saved in {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare_to_baseline(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            raise SystemExit(1)
+
+    if args.clean:
+        shutil.rmtree(args.work_dir)
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,132 @@
 import sys
+import csv
+import hashlib
+import gzip
+import json
+import time
+import sqlite3
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import io
+import shutil
 from zipfile import ZipFile
 from google.cloud import storage
 from google.cloud import pubsub_v1
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
 from pyspark.sql.dataframe import DataFrame
 from pyspark.sql import functions as F
-from pyspark.sql.window import Window
+from pyspark.sql.types import (StructType, StructField, StringType, IntegerType,
+                               LongType, DoubleType, BooleanType, TimestampType)
+
+# Input schema
+# Bump the version and add a new entry when the source columns change.
+CRIMES_SCHEMA_VERSION = 1
+CRIMES_SCHEMAS = {
+    1: StructType([
+        StructField("ID", LongType()),
+        StructField("Case Number", StringType()),
+        StructField("Date", TimestampType()),
+        StructField("Block", StringType()),
+        StructField("IUCR", StringType()),
+        StructField("Primary Type", StringType()),
+        StructField("Description", StringType()),
+        StructField("Location Description", StringType()),
+        StructField("Arrest", BooleanType()),
+        StructField("Domestic", BooleanType()),
+        StructField("Beat", IntegerType()),
+        StructField("District", IntegerType()),
+        StructField("Ward", IntegerType()),
+        StructField("Community Area", IntegerType()),
+        StructField("FBI Code", StringType()),
+        StructField("X Coordinate", DoubleType()),
+        StructField("Y Coordinate", DoubleType()),
+        StructField("Year", IntegerType()),
+        StructField("Updated On", TimestampType()),
+        StructField("Latitude", DoubleType()),
+        StructField("Longitude", DoubleType()),
+        StructField("Location", StringType()),
+    ])
+}
+CRIMES_TIMESTAMP_FORMAT = 'MM/dd/yyyy hh:mm:ss a'
+# Drifts found in the csv header, published with the completion message
+SCHEMA_DRIFTS = []
+
+# Size of the chunks read from and uploaded to GCS when unzipping (multiple of 256 KB)
+UNZIP_CHUNK_SIZE = 32 * 1024 * 1024
+# Metadata of the unzipped file holding the generation of the zip file it was unzipped from
+UNZIPPED_FROM_METADATA = 'unzipped_from_generation'
+
+# Gzip shards streamed from the zipped data file, each one is read by a different Spark task
+SHARDS_PREFIX = 'shards'
+SHARD_SIZE = 128 * 1024 * 1024  # uncompressed bytes per shard
+SHARD_COMPRESS_LEVEL = 1
+
+# Columnar copy of the raw data with the time columns and the dimension codes,
+# one directory per source fingerprint and year shift
+INGESTED_DATA_PREFIX = 'ingested'
+INGESTED_PARTITION_COLUMN = 'Year'
+# Bump when the columns added to the copy change
+INGESTED_DATA_VERSION = 1
+# Incremental runs: one append-only copy, each source version appends its new rows as a batch directory
+INCREMENTAL_COPY_NAME = 'incremental'
+INGESTION_STATE_FILE = '_ingestion_state.json'  # ignored by the parquet reader (leading underscore)
+
+# Categorical columns coded as integers, the labels are kept in small dimension tables next to the copies.
+# Codes are only appended: a label keeps its code for all the source versions (the stored aggregates use them).
+DIMENSION_COLUMNS = ["Primary Type", "Location Description"]
+DIMENSIONS_PREFIX = 'dimensions'
+
+# Columns derived from the shifted Date
+DERIVED_TIME_COLUMNS = ["Year", "Month", "Hour", "Weekday", "DateKey"]
+# Above this share of the crimes in a single hour, the time of day is considered lost
+HOUR_CHECK_MAX_SHARE = 0.5
+
+# Crime counts shared by all the reports
+CRIMES_BASE_KEYS = ["Year", "Month", "Hour", "Primary Type ID", "Location Description ID", "Arrest"]
+# Bump when the way the base is computed changes, the stored aggregates are then rebuilt
+# 2: Hour keeps the time of day, 3: dimension codes
+CRIMES_BASE_VERSION = 3
+
+# Stored crime counts updated by the incremental runs
+AGGREGATES_PREFIX = 'aggregates'
+
+# Tables written by the bigquery sink, swapped into the final tables by the load function
+STAGING_TABLE_SUFFIX = '_staging'
+SQLITE_TYPES = {'int': 'INTEGER', 'bigint': 'INTEGER', 'boolean': 'INTEGER', 'double': 'REAL', 'float': 'REAL'}
+
+# Completion message: versioned json, gzip compressed or stored in GCS when it is large
+MESSAGE_SCHEMA_VERSION = 1
+MESSAGE_COMPRESS_MIN_BYTES = 16 * 1024
+MESSAGE_MAX_BYTES = 1024 * 1024  # above, the message only points to a manifest object (pub/sub limit: 10 MB)
+MANIFESTS_PREFIX = 'manifests'
+# written once the completion message is published, the watchdog checks it for the jobs ended DONE
+COMPLETION_MARKER_NAME = '_job_completed.json'
+
+# Run metrics, one entry per measured stage, published with the completion message
+RUN_METRICS_PREFIX = 'run_metrics'
+SPARK_STAGE_METRICS = ['inputBytes', 'inputRecords', 'outputBytes', 'outputRecords',
+                       'shuffleReadBytes', 'shuffleWriteBytes', 'memoryBytesSpilled', 'diskBytesSpilled',
+                       'executorRunTime']
+STAGE_METRICS = []
+
+# Optional "key=value" arguments given after the positional ones.
+DEFAULT_JOB_OPTIONS = {
+    'schema_validation': 'warn',  # off | warn | strict
+    'ingestion': 'parquet',       # parquet (cached columnar copy) | csv (parse the csv every run)
+    'extraction': 'csv',          # csv (unzipped copy in the bucket) | gzip_shards (no uncompressed copy)
+    'incremental': 'false',       # true: only aggregate the rows above the stored high-water mark
+    'report_workers': '1',        # number of reports computed and written concurrently
+    'backend': '',                # backend running the job (cluster | serverless | local), set by the functions
+    'submitted_at': '',           # submission unix time, set by the functions
+    'sink': 'parquet',            # parquet (loaded by the load function) | bigquery (direct write) | local (sqlite file)
+    'bigquery_dataset': '',       # project.dataset of the bigquery sink, set by the functions
+    'local_sink_path': '/tmp/crimes_reports.sqlite',
+    'year_shift_years': '3',      # whole years added to the crime dates
+    'result_key': '',             # result cache key of the run, set by the functions
+}
 
 # Configuration
 def get_config()->tuple:
@@ -16,9 +135,9 @@ def get_config()->tuple:
     Returns:
         tuple: arguments: DATA_BUCKET_NAME, DATA_FILE_NAME, PROJECT_ID, TOPIC_NAME
     """
-    if len(sys.argv) != 5:
+    if len(sys.argv) < 5:
         print("Error: missing arguments\nUsage: python script_name.py \
-            <DATA_BUCKET_NAME> <DATA_FILE_NAME> <PROJECT_ID> <TOPIC_NAME>")
+            <DATA_BUCKET_NAME> <DATA_FILE_NAME> <PROJECT_ID> <TOPIC_NAME> [key=value ...]")
         sys.exit(1)
     DATA_BUCKET_NAME = sys.argv[1]
     DATA_FILE_NAME   = sys.argv[2]
@@ -31,10 +150,179 @@ def get_config()->tuple:
     print(f"Topic name: {TOPIC_NAME}")
     return DATA_BUCKET_NAME, DATA_FILE_NAME, PROJECT_ID, TOPIC_NAME
 
+def get_job_options()->dict:
+    """Return the optional job arguments, given as key=value after the positional ones.
+
+    Returns:
+        dict: job options, the defaults being overridden by the provided arguments
+    """
+    options = dict(DEFAULT_JOB_OPTIONS)
+    for arg in sys.argv[5:]:
+        key, separator, value = arg.partition('=')
+        if not separator or key not in options:
+            print(f"Ignoring unknown job option '{arg}'.")
+            continue
+        options[key] = value
+    print(f"Job options: {options}")
+    return options
+
+def get_year_shift(options:dict)->int:
+    """Return the number of years added to the crime dates.
+
+    Args:
+        options (dict): job options
+
+    Returns:
+        int: year shift
+    """
+    try:
+        return int(options['year_shift_years'])
+    except ValueError:
+        raise ValueError(f"year_shift_years must be an integer, got '{options['year_shift_years']}'.")
+
+# Clients
+# Created once per job and shared by all the steps (and threads) instead of one per call
+CLIENTS = {}
+
+def get_storage_client()->storage.Client:
+    """Return the Google Cloud Storage client of the job.
+
+    Returns:
+        storage.Client: Google Cloud Storage client
+    """
+    if 'storage' not in CLIENTS:
+        CLIENTS['storage'] = storage.Client()
+    return CLIENTS['storage']
+
+def get_publisher_client()->pubsub_v1.PublisherClient:
+    """Return the Pub Sub publisher client of the job.
+
+    Returns:
+        pubsub_v1.PublisherClient: publisher client
+    """
+    if 'publisher' not in CLIENTS:
+        print('Creating a publisher client.')
+        CLIENTS['publisher'] = pubsub_v1.PublisherClient()
+    return CLIENTS['publisher']
+
+# Instrumentation
+def get_spark_group_metrics(spark_session:SparkSession, group:str)->dict:
+    """Sum the metrics of the Spark stages run by a job group.
+    The byte and record counts come from the Spark UI REST api, they are skipped if it is not reachable.
+
+    Args:
+        spark_session (SparkSession): spark session
+        group (str): job group id
+
+    Returns:
+        dict: number of spark jobs and stages, summed stage metrics
+    """
+    spark_context = spark_session.sparkContext
+    tracker = spark_context.statusTracker()
+    job_ids = tracker.getJobIdsForGroup(group)
+    stage_ids = []
+    for job_id in job_ids:
+        job_info = tracker.getJobInfo(job_id)
+        if job_info is not None:
+            stage_ids.extend(job_info.stageIds)
+    metrics = {'spark_jobs': len(job_ids), 'spark_stages': len(stage_ids)}
+
+    ui_url = spark_context.uiWebUrl
+    if not ui_url:
+        return metrics
+    try:
+        totals = dict.fromkeys(SPARK_STAGE_METRICS, 0)
+        for stage_id in stage_ids:
+            url = f'{ui_url}/api/v1/applications/{spark_context.applicationId}/stages/{stage_id}'
+            with urllib.request.urlopen(url, timeout=5) as response:
+                for attempt in json.loads(response.read()):
+                    for key in SPARK_STAGE_METRICS:
+                        totals[key] += attempt.get(key, 0)
+        metrics.update(totals)
+    except Exception as e:
+        print(f'Spark stage metrics of {group} not available: {e}')
+    return metrics
+
+@contextmanager
+def measure_stage(name:str, spark_session:SparkSession=None):
+    """Record the duration and status of a processing step in STAGE_METRICS.
+    With a spark session, the Spark jobs of the step are grouped to also record their stage metrics.
+    Each call gets its own job group: a step name used twice in a session does not sum both runs.
+
+    Args:
+        name (str): step name
+        spark_session (SparkSession, optional): spark session. Defaults to None.
+
+    Yields:
+        dict: step metrics, the caller can add its own (rows, bytes, ...)
+    """
+    metrics = {'stage': name}
+    group = f'{name}-{uuid.uuid4().hex[:8]}'
+    if spark_session is not None:
+        # job groups are set per thread
+        spark_session.sparkContext.setJobGroup(group, name)
+    start = time.perf_counter()
+    try:
+        yield metrics
+        metrics['status'] = 'SUCCESS'
+    except Exception:
+        metrics['status'] = 'FAILED'
+        raise
+    finally:
+        metrics['duration_s'] = round(time.perf_counter() - start, 3)
+        if spark_session is not None:
+            metrics.update(get_spark_group_metrics(spark_session, group))
+            spark_session.sparkContext.setLocalProperty("spark.jobGroup.id", None)
+        STAGE_METRICS.append(metrics)
+        print(f'Stage metrics: {metrics}')
+
+def list_gcs_dir_files(bucket_name:str, dir_path:str)->list:
+    """Return the files under a directory of a bucket.
+
+    Args:
+        bucket_name (str): bucket name
+        dir_path (str): directory path
+
+    Returns:
+        list: {'name': file path, 'size': bytes} for each file
+    """
+    client = get_storage_client()
+    return [{'name': blob.name, 'size': blob.size} for blob in client.list_blobs(bucket_name, prefix=f'{dir_path}/')]
+
+def get_gcs_dir_size(bucket_name:str, dir_path:str)->tuple:
+    """Return the number of files and bytes under a directory of a bucket.
+
+    Args:
+        bucket_name (str): bucket name
+        dir_path (str): directory path
+
+    Returns:
+        tuple: number of files, number of bytes
+    """
+    sizes = [file['size'] for file in list_gcs_dir_files(bucket_name, dir_path)]
+    return len(sizes), sum(sizes)
+
+def save_run_metrics(bucket_name:str, run_metrics:dict)->str:
+    """Dump the run metrics as a json file in the data bucket.
+
+    Args:
+        bucket_name (str): data bucket name
+        run_metrics (dict): run metrics
+
+    Returns:
+        str: run metrics file path
+    """
+    path = f"{RUN_METRICS_PREFIX}/{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    blob = get_storage_client().bucket(bucket_name).blob(path)
+    blob.upload_from_string(json.dumps(run_metrics, indent=2), content_type="application/json")
+    print(f'Run metrics saved in gs://{bucket_name}/{path}')
+    return path
+
 # Utils
 def unzip_files(bucket_name:str, file_name:str)->str:
-    """Check if the data.csv is in the data bucket, if so returns its path.
+    """Check if the data.csv is in the data bucket and was unzipped from the current data.csv.zip, if so returns its path.
     If not, check if data.csv.zip file is in the bucket, if so, unzip it and return its path.
+    The unzipped file records the generation of the zip file it comes from, a new zip file is unzipped again.
 
     Args:
         bucket_name (str): data bucket name
@@ -44,7 +332,7 @@ def unzip_files(bucket_name:str, file_name:str)->str:
         str: datafile path
     """
     # Initialize a Google Cloud Storage client
-    client = storage.Client()
+    client = get_storage_client()
 
     # Get the bucket
     bucket = client.get_bucket(bucket_name)
@@ -55,50 +343,227 @@ def unzip_files(bucket_name:str, file_name:str)->str:
     print(f'zipped python job file name : {zip_file}')
 
     print(f"Searching for '{file_name}' in gs://{bucket_name}")
-    # Check if the original file exists in the bucket
-    original_blob = bucket.blob(file_name)
-    if original_blob.exists():
-        print(f"File '{file_name}' found in the bucket.")
-    else:
-        # If the original file is not found, try finding and unzipping a file with .zip extension
-        print(f"'{file_name}' not found in gs://{bucket_name}")
-        zip_blob = bucket.blob(zip_file)
+    original_blob = bucket.get_blob(file_name)
+    zip_blob = bucket.get_blob(zip_file)
+    if zip_blob is None:
+        if original_blob is None:
+            print(f"Neither file '{file_name}' nor zip file '{zip_file}' found. Running target function...")
+        else:
+            print(f"File '{file_name}' found in the bucket.")
+        return file_name
+
+    # Check if the original file exists in the bucket and comes from the current zip file
+    unzipped_from = (original_blob.metadata or {}).get(UNZIPPED_FROM_METADATA) if original_blob is not None else None
+    if unzipped_from == str(zip_blob.generation):
+        print(f"File '{file_name}' found in the bucket, unzipped from the current '{zip_file}'.")
+        return file_name
+    if original_blob is not None:
+        print(f"'{file_name}' does not come from the current '{zip_file}' (generation {zip_blob.generation}).")
+
+    print(f"Zip file '{zip_file}' found in the bucket. Unzipping...")
+    # Stream the zip file from the bucket (ranged reads, the archive is never fully loaded)
+    with zip_blob.open("rb", chunk_size=UNZIP_CHUNK_SIZE) as zip_stream, \
+         ZipFile(zip_stream, "r") as zip_ref:
+        # Assume the unzipped file has the same name as the original file
+        unzipped_file_name = file_name
+
+        # Decompress chunk by chunk into a resumable upload of the unzipped file
+        unzipped_blob = bucket.blob(unzipped_file_name, chunk_size=UNZIP_CHUNK_SIZE)
+        unzipped_blob.metadata = {UNZIPPED_FROM_METADATA: str(zip_blob.generation)}
+        with zip_ref.open(unzipped_file_name) as member, \
+             unzipped_blob.open("wb", content_type="application/octet-stream") as upload:
+            shutil.copyfileobj(member, upload, UNZIP_CHUNK_SIZE)
+
+        print(f"Unzipped file '{unzipped_file_name}' uploaded to the bucket.")
+    return file_name
+
+def iter_line_blocks(stream, block_size:int):
+    """Read a binary stream by blocks that always end on a line boundary.
 
-        if zip_blob.exists():
-            print(f"Zip file '{zip_file}' found in the bucket. Unzipping...")
+    Args:
+        stream (): binary file object
+        block_size (int): size of the reads
 
-            # Download the zip file as bytes
-            zip_file_content = io.BytesIO()
-            zip_blob.download_to_file(zip_file_content)
+    Yields:
+        bytes: block of complete lines
+    """
+    remainder = b''
+    while True:
+        chunk = stream.read(block_size)
+        if not chunk:
+            break
+        data = remainder + chunk
+        cut = data.rfind(b'\n') + 1
+        if not cut:
+            remainder = data
+            continue
+        remainder = data[cut:]
+        yield data[:cut]
+    if remainder:
+        yield remainder
+
+def unzip_to_gzip_shards(bucket_name:str, file_name:str)->str:
+    """Stream the zipped data file into gzip compressed csv shards, each one starting with the header.
+    Gzip files are not splittable, so the shards are what gives Spark its read parallelism.
+    No uncompressed copy is written to the bucket.
 
-            # Unzip the file in memory
-            with ZipFile(zip_file_content, "r") as zip_ref:
-                # Assume the unzipped file has the same name as the original file
-                unzipped_file_name = file_name
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
 
-                # Read the unzipped file content
-                unzipped_file_content = zip_ref.read(unzipped_file_name)
+    Return:
+        str: path of the shards directory, or the data file path if no zip file is found
+    """
+    client = get_storage_client()
+    bucket = client.bucket(bucket_name)
+    zip_blob = bucket.blob(f'{file_name}.zip')
+    if not zip_blob.exists():
+        print(f"Zip file '{file_name}.zip' not found, reading '{file_name}'.")
+        return file_name
+
+    shards_path = f'{SHARDS_PREFIX}/{file_name}'
+    # Remove the shards of a previous run
+    for blob in client.list_blobs(bucket_name, prefix=f'{shards_path}/'):
+        blob.delete()
+
+    print(f"Streaming '{file_name}.zip' into gzip shards in gs://{bucket_name}/{shards_path}")
+    shard_count = 0
+    shard, upload, shard_size = None, None, 0
+    with zip_blob.open("rb", chunk_size=UNZIP_CHUNK_SIZE) as zip_stream, \
+         ZipFile(zip_stream, "r") as zip_ref, \
+         zip_ref.open(file_name) as member:
+        header = member.readline()
+        for block in iter_line_blocks(member, UNZIP_CHUNK_SIZE):
+            if shard is None:
+                shard_blob = bucket.blob(f'{shards_path}/part-{shard_count:05d}.csv.gz', chunk_size=UNZIP_CHUNK_SIZE)
+                upload = shard_blob.open("wb", ignore_flush=True, content_type="application/gzip")
+                shard = gzip.GzipFile(fileobj=upload, mode="wb", compresslevel=SHARD_COMPRESS_LEVEL)
+                shard.write(header)
+                shard_count += 1
+            shard.write(block)
+            shard_size += len(block)
+            if shard_size >= SHARD_SIZE:
+                shard.close()
+                upload.close()
+                shard, upload, shard_size = None, None, 0
+        if shard is not None:
+            shard.close()
+            upload.close()
+
+    print(f'{shard_count} gzip shards uploaded.')
+    return shards_path
+
+def get_source_fingerprint(bucket_name:str, file_name:str)->str:
+    """Return a fingerprint of the source data file based on its metadata only.
+    The zipped file is preferred since it is the one uploaded by terraform.
+
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
 
-                # Upload the unzipped file back to the bucket
-                unzipped_blob = bucket.blob(unzipped_file_name)
-                unzipped_blob.upload_from_string(unzipped_file_content, content_type="application/octet-stream")
+    Returns:
+        str: source fingerprint or "" if no source file is found
+    """
+    client = get_storage_client()
+    bucket = client.bucket(bucket_name)
+    for blob_name in (f'{file_name}.zip', file_name):
+        blob = bucket.get_blob(blob_name)
+        if blob is not None:
+            key = f'{blob_name}:{blob.size}:{blob.generation}:{blob.md5_hash}:schema-v{CRIMES_SCHEMA_VERSION}'
+            fingerprint = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+            print(f"Source '{blob_name}' fingerprint: {fingerprint}")
+            return fingerprint
+    return ""
+
+def get_ingested_data_path(file_name:str, fingerprint:str, year_shift:int)->str:
+    """Return the path of the columnar copy of a source file.
 
-                print(f"Unzipped file '{unzipped_file_name}' uploaded to the bucket.")
+    Args:
+        file_name (str): data file name
+        fingerprint (str): source fingerprint
+        year_shift (int): years added to the dates of the copy
 
-        else:
-            print(f"Neither file '{file_name}' nor zip file '{zip_file}' found. Running target function...")
+    Returns:
+        str: ingested data path inside the data bucket
+    """
+    return f"{INGESTED_DATA_PREFIX}/{file_name}/{fingerprint}/v{INGESTED_DATA_VERSION}_shift_{year_shift}y"
+
+def delete_previous_ingested_copies(bucket_name:str, file_name:str, ingested_path:str)->int:
+    """Delete the columnar copies of the previous versions of a source file (other fingerprint, version or shift).
+    The incremental copy and the dimension tables are kept.
+
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
+        ingested_path (str): ingested data path of the current copy
 
-def build_spark_session(app_name:str)->SparkSession:
+    Returns:
+        int: number of deleted objects
+    """
+    kept_prefixes = (f'{ingested_path}/',
+                     f'{INGESTED_DATA_PREFIX}/{file_name}/{INCREMENTAL_COPY_NAME}/',
+                     f'{INGESTED_DATA_PREFIX}/{file_name}/{DIMENSIONS_PREFIX}/')
+    deleted = 0
+    for blob in get_storage_client().list_blobs(bucket_name, prefix=f'{INGESTED_DATA_PREFIX}/{file_name}/'):
+        if not blob.name.startswith(kept_prefixes):
+            blob.delete()
+            deleted += 1
+    if deleted:
+        print(f'Deleted {deleted} objects of the previous columnar copies of {file_name}.')
+    return deleted
+
+def is_ingested(bucket_name:str, ingested_path:str)->bool:
+    """Check if a complete columnar copy exists (Spark writes a _SUCCESS marker at the end).
+
+    Args:
+        bucket_name (str): data bucket name
+        ingested_path (str): ingested data path
+
+    Returns:
+        bool: True if the copy can be reused
+    """
+    client = get_storage_client()
+    return client.bucket(bucket_name).blob(f'{ingested_path}/_SUCCESS').exists()
+
+def get_code_column(column:str)->str:
+    """Return the name of the integer code column of a categorical column.
+
+    Args:
+        column (str): categorical column name
+
+    Returns:
+        str: code column name
+    """
+    return f'{column} ID'
+
+def get_dimension_path(file_name:str, column:str)->str:
+    """Return the path of the dimension table of a categorical column.
+
+    Args:
+        file_name (str): data file name
+        column (str): categorical column name
+
+    Returns:
+        str: dimension table path inside the data bucket
+    """
+    return f"{INGESTED_DATA_PREFIX}/{file_name}/{DIMENSIONS_PREFIX}/{column.lower().replace(' ', '_')}"
+
+def build_spark_session(app_name:str, fair_scheduling:bool=False)->SparkSession:
     """Build a spark session.
 
     Args:
         app_name (str): session name
+        fair_scheduling (bool, optional): share the executors between the concurrent jobs
+            instead of running them first in first out. Defaults to False.
 
     Returns:
         SparkSession: the spark session object.
     """
     print('Building spark session ...')
-    spark = SparkSession.builder.appName("CrimeDataAnalysis").getOrCreate()
+    builder = SparkSession.builder.appName("CrimeDataAnalysis")
+    if fair_scheduling:
+        builder = builder.config("spark.scheduler.mode", "FAIR")
+    spark = builder.getOrCreate()
     print('Spark session built.')
     return spark
 
@@ -114,17 +579,298 @@ def get_object_uri(bucket_name:str, file_path:str)->str:
     """
     return f"gs://{bucket_name}/{file_path}"
 
-def pull_gcs_csv_to_df(file_uri:str, spark_session:SparkSession)->DataFrame:
-    """Download a csv file from GCS and load it in a spark dataframe.
+def get_crimes_schema(version:int=CRIMES_SCHEMA_VERSION)->StructType:
+    """Return the declared schema of the crimes csv file.
+
+    Args:
+        version (int, optional): schema version. Defaults to CRIMES_SCHEMA_VERSION.
+
+    Returns:
+        StructType: crimes csv schema
+    """
+    if version not in CRIMES_SCHEMAS:
+        raise ValueError(f"Unknown crimes schema version: {version}.")
+    return CRIMES_SCHEMAS[version]
+
+def check_csv_schema_drift(file_uri:str, spark_session:SparkSession, schema:StructType)->list:
+    """Compare the header of a csv file with a declared schema.
+    Only the first line of the file is read.
+
+    Args:
+        file_uri (str): file bucket uri
+        spark_session (SparkSession): spark session
+        schema (StructType): expected schema
+
+    Returns:
+        list: drift descriptions, empty if the header matches the schema
+    """
+    header = spark_session.read.text(file_uri).first()
+    found_columns = next(csv.reader([header.value])) if header else []
+    expected_columns = schema.names
+
+    drifts = []
+    missing = [name for name in expected_columns if name not in found_columns]
+    unexpected = [name for name in found_columns if name not in expected_columns]
+    if missing:
+        drifts.append(f'missing columns: {missing}')
+    if unexpected:
+        drifts.append(f'unexpected columns: {unexpected}')
+    if not missing and not unexpected and found_columns != expected_columns:
+        drifts.append(f'column order changed: {found_columns}')
+    return drifts
+
+def pull_gcs_csv_to_df(file_uri:str, spark_session:SparkSession, validation:str='warn')->DataFrame:
+    """Download a csv file from GCS and load it in a spark dataframe using the declared schema.
 
     Args:
         file_uri (str): file bucket uri
+        spark_session (SparkSession): spark session
+        validation (str, optional): schema drift handling: 'off', 'warn' (report it)
+            or 'strict' (fail on drift and on malformed rows). Defaults to 'warn'.
 
     Returns:
         DataFrame: data loaded into the dataframe
     """
+    schema = get_crimes_schema()
+    if validation != 'off':
+        drifts = check_csv_schema_drift(file_uri, spark_session, schema)
+        for drift in drifts:
+            print(f'Schema drift (version {CRIMES_SCHEMA_VERSION}): {drift}')
+        SCHEMA_DRIFTS.extend(drifts)
+        if drifts and validation == 'strict':
+            raise ValueError(f'The header of {file_uri} does not match the crimes schema version {CRIMES_SCHEMA_VERSION}.')
+
     print(f'Downloading {file_uri}')
-    return spark_session.read.csv(file_uri, header=True, inferSchema=True)
+    return spark_session.read.csv(file_uri,
+                                  header=True,
+                                  schema=schema,
+                                  timestampFormat=CRIMES_TIMESTAMP_FORMAT,
+                                  mode='FAILFAST' if validation == 'strict' else 'PERMISSIVE')
+
+def pull_gcs_parquet_to_df(file_uri:str, spark_session:SparkSession)->DataFrame:
+    """Load a parquet dataset from GCS in a spark dataframe.
+
+    Args:
+        file_uri (str): parquet dataset uri
+        spark_session (SparkSession): spark session
+
+    Returns:
+        DataFrame: data loaded into the dataframe
+    """
+    print(f'Reading parquet dataset {file_uri}')
+    return spark_session.read.parquet(file_uri)
+
+def ingest_df_to_gcs_parquet(df:DataFrame, file_uri:str)->None:
+    """Write the raw data as a parquet dataset partitioned by year.
+    An existing dataset at the same uri is replaced.
+
+    Args:
+        df (DataFrame): raw data
+        file_uri (str): parquet dataset uri
+    """
+    print(f"Ingesting raw data into {file_uri}.")
+    df.write.partitionBy(INGESTED_PARTITION_COLUMN).parquet(file_uri, mode="overwrite")
+    print('Raw data ingested.')
+
+def pull_dimensions(bucket_name:str, file_name:str, spark_session:SparkSession)->dict:
+    """Load the stored dimension tables.
+
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
+        spark_session (SparkSession): spark session
+
+    Returns:
+        dict: {categorical column: dimension DataFrame}, without the columns having no stored table
+    """
+    dimensions = {}
+    for column in DIMENSION_COLUMNS:
+        dimension_path = get_dimension_path(file_name, column)
+        if is_ingested(bucket_name, dimension_path):
+            dimensions[column] = pull_gcs_parquet_to_df(get_object_uri(bucket_name, dimension_path), spark_session)
+    return dimensions
+
+def build_dimensions(df:DataFrame, spark_session:SparkSession, known_dimensions:dict=None)->tuple:
+    """Give an integer code to each label of the categorical columns, in a single scan of the data.
+    The known labels keep their code and the new ones get the next codes.
+
+    Args:
+        df (DataFrame): crimes data
+        spark_session (SparkSession): spark session
+        known_dimensions (dict, optional): {categorical column: dimension DataFrame} to extend. Defaults to None.
+
+    Returns:
+        tuple: {categorical column: dimension DataFrame}, {categorical column: number of new labels}
+    """
+    known_dimensions = known_dimensions or {}
+    rows = df.select(*DIMENSION_COLUMNS).distinct().collect()
+
+    dimensions, new_labels = {}, {}
+    for column in DIMENSION_COLUMNS:
+        code_column = get_code_column(column)
+        codes = {}
+        if column in known_dimensions:
+            codes = {row[column]: row[code_column] for row in known_dimensions[column].collect()}
+        labels = sorted({row[column] for row in rows} - codes.keys(), key=lambda label: (label is not None, label))
+        for label in labels:
+            codes[label] = len(codes)
+        schema = StructType([StructField(code_column, IntegerType(), False), StructField(column, StringType())])
+        dimensions[column] = spark_session.createDataFrame([(code, label) for label, code in codes.items()], schema)
+        new_labels[column] = len(labels)
+    return dimensions, new_labels
+
+def save_dimensions(dimensions:dict, new_labels:dict, bucket_name:str, file_name:str)->None:
+    """Write the dimension tables having new labels, as a single small parquet file each.
+
+    Args:
+        dimensions (dict): {categorical column: dimension DataFrame}
+        new_labels (dict): {categorical column: number of new labels}
+        bucket_name (str): data bucket name
+        file_name (str): data file name
+    """
+    for column, dimension in dimensions.items():
+        if not new_labels[column]:
+            continue
+        dimension_uri = get_object_uri(bucket_name, get_dimension_path(file_name, column))
+        dimension.coalesce(1).write.parquet(dimension_uri, mode="overwrite")
+        print(f"{new_labels[column]} new '{column}' labels saved in {dimension_uri}.")
+
+def encode_dimensions(df:DataFrame, dimensions:dict)->DataFrame:
+    """Add the integer code columns of the categorical columns, with broadcast joins on the dimension tables.
+
+    Args:
+        df (DataFrame): crimes data
+        dimensions (dict): {categorical column: dimension DataFrame}
+
+    Returns:
+        DataFrame: crimes data with the code columns
+    """
+    for column, dimension in dimensions.items():
+        dimension = dimension.withColumnRenamed(column, '_label')
+        # null labels have a code too
+        df = df.join(F.broadcast(dimension), df[column].eqNullSafe(dimension['_label']), 'left').drop('_label')
+    return df
+
+def extract_csv_data(bucket_name:str, file_name:str, options:dict)->str:
+    """Make the csv data readable by Spark: unzipped csv file or gzip shards.
+
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
+        options (dict): job options
+
+    Returns:
+        str: csv data uri
+    """
+    with measure_stage('extract') as metrics:
+        if options['extraction'] == 'gzip_shards':
+            csv_data_path = unzip_to_gzip_shards(bucket_name, file_name)
+            metrics['output_files'], metrics['output_bytes'] = get_gcs_dir_size(bucket_name, csv_data_path)
+        else:
+            unzip_files(bucket_name, file_name)
+            csv_data_path = file_name
+    return get_object_uri(bucket_name, csv_data_path)
+
+def pull_incremental_crimes_df(bucket_name:str,
+                               file_name:str,
+                               fingerprint:str,
+                               spark_session:SparkSession,
+                               options:dict)->tuple:
+    """Load the crimes data from the append-only copy of the incremental runs.
+    For a new source version, the csv is parsed but only the rows with an ID above the high-water mark of the copy
+    get the time columns and the codes, and are written as a new batch directory of the copy.
+    Running a source version again rewrites the same batch.
+
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
+        fingerprint (str): source fingerprint
+        spark_session (SparkSession): spark session
+        options (dict): job options
+
+    Returns:
+        tuple: crimes data, {categorical column: dimension DataFrame}
+    """
+    ingested_path = get_ingested_data_path(file_name, INCREMENTAL_COPY_NAME, get_year_shift(options))
+    ingested_uri = get_object_uri(bucket_name, ingested_path)
+    state_blob = get_storage_client().bucket(bucket_name).blob(f'{ingested_path}/{INGESTION_STATE_FILE}')
+    state = json.loads(state_blob.download_as_text()) if state_blob.exists() else {}
+
+    if state.get('fingerprint') != fingerprint:
+        high_water_mark = state.get('high_water_mark', -1)
+        print(f'Appending the rows with an ID above {high_water_mark} to the incremental copy.')
+        csv_data_uri = extract_csv_data(bucket_name, file_name, options)
+        df = pull_gcs_csv_to_df(csv_data_uri, spark_session, options['schema_validation'])
+        delta = add_time_columns(df.filter(F.col("ID") > high_water_mark), get_year_shift(options))
+        delta = delta.persist(StorageLevel.MEMORY_AND_DISK)
+        with measure_stage('dimensions', spark_session) as metrics:
+            known_dimensions = pull_dimensions(bucket_name, file_name, spark_session)
+            dimensions, metrics['new_labels'] = build_dimensions(delta, spark_session, known_dimensions)
+            save_dimensions(dimensions, metrics['new_labels'], bucket_name, file_name)
+        with measure_stage('ingest', spark_session) as metrics:
+            batch_uri = f'{ingested_uri}/batch={fingerprint}'
+            ingest_df_to_gcs_parquet(encode_dimensions(delta, dimensions), batch_uri)
+            metrics['rows'] = delta.count()
+            delta_high_water_mark = delta.agg(F.max("ID")).first()[0]
+        delta.unpersist()
+        state = {'fingerprint': fingerprint,
+                 'high_water_mark': max(high_water_mark, delta_high_water_mark or -1)}
+        state_blob.upload_from_string(json.dumps(state), content_type="application/json")
+        print(f'Incremental copy state saved: {state}')
+    else:
+        print('Source file already appended to the incremental copy, skipping the csv parsing.')
+
+    return (pull_gcs_parquet_to_df(ingested_uri, spark_session),
+            pull_dimensions(bucket_name, file_name, spark_session))
+
+def pull_crimes_df(bucket_name:str, file_name:str, spark_session:SparkSession, options:dict)->tuple:
+    """Load the crimes data with the time columns and the dimension codes. The csv is parsed, the time columns
+    and the codes are derived only once per source file version: they are then read from the parquet copy.
+
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
+        spark_session (SparkSession): spark session
+        options (dict): job options
+
+    Returns:
+        tuple: crimes data, {categorical column: dimension DataFrame}, parsed csv cached for the crimes base
+            (csv ingestion only, else None) to be unpersisted by the caller once the base is built
+    """
+    use_parquet = options['ingestion'] == 'parquet'
+    fingerprint = get_source_fingerprint(bucket_name, file_name) if use_parquet else ""
+    if fingerprint and options['incremental'] == 'true':
+        df, dimensions = pull_incremental_crimes_df(bucket_name, file_name, fingerprint, spark_session, options)
+        return df, dimensions, None
+    ingested_path = get_ingested_data_path(file_name, fingerprint, get_year_shift(options))
+    ingested_uri = get_object_uri(bucket_name, ingested_path)
+
+    if fingerprint and is_ingested(bucket_name, ingested_path):
+        print('Source file already ingested, skipping the csv parsing.')
+        return (pull_gcs_parquet_to_df(ingested_uri, spark_session),
+                pull_dimensions(bucket_name, file_name, spark_session),
+                None)
+
+    csv_data_uri = extract_csv_data(bucket_name, file_name, options)
+    df = add_time_columns(pull_gcs_csv_to_df(csv_data_uri, spark_session, options['schema_validation']),
+                          get_year_shift(options))
+    # parsed once: the dimensions scan fills the cache, the ingestion (or the crimes base) reads it
+    parsed_df = df.persist(StorageLevel.MEMORY_AND_DISK)
+    with measure_stage('dimensions', spark_session) as metrics:
+        known_dimensions = pull_dimensions(bucket_name, file_name, spark_session)
+        dimensions, metrics['new_labels'] = build_dimensions(parsed_df, spark_session, known_dimensions)
+        save_dimensions(dimensions, metrics['new_labels'], bucket_name, file_name)
+    df = encode_dimensions(parsed_df, dimensions)
+    if not fingerprint:
+        return df, dimensions, parsed_df
+
+    with measure_stage('ingest', spark_session) as metrics:
+        ingest_df_to_gcs_parquet(df, ingested_uri)
+        metrics['output_files'], metrics['output_bytes'] = get_gcs_dir_size(bucket_name, ingested_path)
+    parsed_df.unpersist()
+    # the copy of the new source version is complete, the previous ones are never read again
+    delete_previous_ingested_copies(bucket_name, file_name, ingested_path)
+    return pull_gcs_parquet_to_df(ingested_uri, spark_session), dimensions, None
 
 def load_df_to_gcs_csv(df:DataFrame, file_uri:str)->None:
     """Upload a dataframe to a csv file in GCS bucket.
@@ -148,89 +894,448 @@ def load_df_to_gcs_parquet(df:DataFrame, file_uri:str)->None:
     df.write.parquet(file_uri, mode="overwrite")
     print('File uploaded.')
 
+def load_df_to_bigquery(df:DataFrame, table_id:str)->None:
+    """Write a dataframe into a BigQuery table with the Spark BigQuery connector.
+    The direct method streams the rows through the Storage Write API, no GCS files are written.
+
+    Args:
+        df (DataFrame): spark DataFrame
+        table_id (str): project.dataset.table id
+    """
+    print(f"Writing into BigQuery table {table_id}.")
+    df.write.format("bigquery").option("table", table_id).option("writeMethod", "direct").mode("overwrite").save()
+    print('Table written.')
+
+def load_df_to_sqlite(df:DataFrame, db_path:str, table_name:str)->int:
+    """Write a small dataframe into a SQLite file on the driver, an offline stand-in for BigQuery.
+
+    Args:
+        df (DataFrame): spark DataFrame
+        db_path (str): SQLite database file path
+        table_name (str): table name
+
+    Returns:
+        int: number of rows written
+    """
+    print(f"Writing table {table_name} into {db_path}.")
+    columns = ', '.join(f'"{name}" {SQLITE_TYPES.get(col_type, "TEXT")}' for name, col_type in df.dtypes)
+    placeholders = ', '.join('?' for _ in df.columns)
+    rows = [tuple(row) for row in df.collect()]
+    with sqlite3.connect(db_path, timeout=60) as connection:
+        connection.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        connection.execute(f'CREATE TABLE "{table_name}" ({columns})')
+        connection.executemany(f'INSERT INTO "{table_name}" VALUES ({placeholders})', rows)
+    print('Table written.')
+    return len(rows)
+
 # PySpark Processing
 def get_current_year()->int:
     return datetime.now().year
 
-def add_3y(df: DataFrame) -> DataFrame:
-    # Format the date and add 3 years to all the dates
-    df = df.withColumn("Date", F.expr("date_add(to_timestamp(Date, 'MM/dd/yyyy hh:mm:ss a'), 3 * 365)"))
-    # Update/Create the Year, Month, and Hour
-    df = df.withColumn("Year", F.year("Date"))
-    df = df.withColumn("Month", F.month("Date"))
-    df = df.withColumn("Hour", F.hour("Date"))
+def add_time_columns(df:DataFrame, year_shift:int=int(DEFAULT_JOB_OPTIONS['year_shift_years']))->DataFrame:
+    """Shift the crime dates and derive the time columns in a single projection.
+    Date is already a timestamp parsed by the csv reader, the shift keeps the time of day and the day of
+    the month (calendar years, a shifted 29th of February becomes the 28th).
+
+    Args:
+        df (DataFrame): raw crimes data
+        year_shift (int, optional): years added to the dates. Defaults to DEFAULT_JOB_OPTIONS.
+
+    Returns:
+        DataFrame: crimes data with the shifted Date and the DERIVED_TIME_COLUMNS
+    """
+    date = F.col("Date") + F.expr(f"make_ym_interval({int(year_shift)}, 0)")
+    kept_columns = [name for name in df.columns if name != "Date" and name not in DERIVED_TIME_COLUMNS]
+    return df.select(*kept_columns,
+                     date.alias("Date"),
+                     F.year(date).alias("Year"),
+                     F.month(date).alias("Month"),
+                     F.hour(date).alias("Hour"),
+                     F.dayofweek(date).alias("Weekday"),
+                     F.date_format(date, "yyyyMMdd").cast("int").alias("DateKey"))
+
+def check_hour_distribution(df:DataFrame)->dict:
+    """Check that the crimes are spread over the hours of the day, a regression guard run by the benchmark.
+    Most of the crimes in a single hour means the time of day was lost (ex: dates truncated to days).
 
+    Args:
+        df (DataFrame): crimes base
+
+    Returns:
+        dict: {hour: crimes}
+    """
+    hours = {row["Hour"]: row["count"] for row in count_crimes(df, "Hour").collect()}
+    total = sum(hours.values())
+    if total and max(hours.values()) > HOUR_CHECK_MAX_SHARE * total:
+        raise ValueError(f'Hour distribution regression, the time of day looks lost: {hours}')
+    return hours
+
+def build_crimes_base(df:DataFrame, storage_level:StorageLevel=StorageLevel.MEMORY_AND_DISK)->DataFrame:
+    """Count the crimes per Year, Month, Hour, Primary Type, Location Description and Arrest.
+    All the reports are answered from this cached pre-aggregate so the raw data is scanned once.
+    It has to be unpersisted by the caller.
+
+    Args:
+        df (DataFrame): crimes data with the time columns
+        storage_level (StorageLevel, optional): cache storage level. Defaults to MEMORY_AND_DISK.
+
+    Returns:
+        DataFrame: crime counts, with a 'count' column
+    """
+    base = df.groupBy(*CRIMES_BASE_KEYS).count().persist(storage_level)
+    # materialize the cache with the single scan of the raw data
+    print(f'Crimes base built: {base.count()} rows.')
+    return base
+
+def count_crimes(df:DataFrame, *keys:str)->DataFrame:
+    """Sum the pre-aggregated crime counts over the given keys.
+
+    Args:
+        df (DataFrame): crimes base
+        keys (str): group by columns
+
+    Returns:
+        DataFrame: keys and 'count' column
+    """
+    return df.groupBy(*keys).agg(F.sum("count").alias("count"))
+
+def get_label_code(dimensions:dict, column:str, label:str)->int:
+    """Return the integer code of a categorical label.
+
+    Args:
+        dimensions (dict): {categorical column: dimension DataFrame}
+        column (str): categorical column name
+        label (str): label
+
+    Returns:
+        int: code, None if the label is unknown
+    """
+    row = dimensions[column].filter(F.col(column) == label).first()
+    return None if row is None else row[get_code_column(column)]
+
+def decode_labels(df:DataFrame, dimensions:dict, *columns:str)->DataFrame:
+    """Replace code columns by their labels, on small report outputs. The row order is not kept.
+
+    Args:
+        df (DataFrame): data with the code columns
+        dimensions (dict): {categorical column: dimension DataFrame}
+        columns (str): categorical column names
+
+    Returns:
+        DataFrame: data with the label columns at the place of the code columns
+    """
+    for column in columns:
+        code_column = get_code_column(column)
+        names = [column if name == code_column else name for name in df.columns]
+        df = df.join(F.broadcast(dimensions[column]), code_column, 'left').select(*names)
     return df
 
-def total_crimes_past_5y_per_month(df:DataFrame)->DataFrame:
-    current_year = get_current_year()
-    # Filter data for the past 5 years
-    df = df.filter((F.col("Year") >= current_year - 5) & (F.col("Year") <= current_year))
-    # Group by month and count the number of crimes for each month
-    df = df.groupBy("Month").count().orderBy("Month")
-    
-    name = 'total_crimes_during_the_past_5_years_per_month'
+def get_aggregates_state(bucket_name:str, file_name:str)->dict:
+    """Return the state of the stored aggregates (path, high-water mark, versions).
 
-    return df, name
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
 
-def top_10_theft_crimes_location_past_3y(df:DataFrame)->DataFrame:
-    current_year = get_current_year()
-    # Filter data for the past 3 years and for "THEFT" crimes
-    df = df.filter((F.col("Year") >= current_year - 3) & (F.col("Year") <= current_year) & (F.col("Primary Type") == "THEFT"))
+    Returns:
+        dict: aggregates state or {} if there are no stored aggregates
+    """
+    blob = get_storage_client().bucket(bucket_name).blob(f'{AGGREGATES_PREFIX}/{file_name}/state.json')
+    if not blob.exists():
+        return {}
+    return json.loads(blob.download_as_text())
 
-    # Group by 'Location Description' and count the number of thefts for each location
-    location_counts = df.groupBy("Location Description").count()
+def save_aggregates_state(bucket_name:str, file_name:str, state:dict)->None:
+    """Save the state of the stored aggregates.
 
-    # Create a window specification to rank locations based on the count
-    window_spec = Window.orderBy(F.desc("count"))
+    Args:
+        bucket_name (str): data bucket name
+        file_name (str): data file name
+        state (dict): aggregates state
+    """
+    blob = get_storage_client().bucket(bucket_name).blob(f'{AGGREGATES_PREFIX}/{file_name}/state.json')
+    blob.upload_from_string(json.dumps(state), content_type="application/json")
+    print(f'Aggregates state saved: {state}')
 
-    # Add a rank column to the DataFrame based on the count
-    ranked_locations = location_counts.withColumn("rank", F.rank().over(window_spec))
+def delete_gcs_dir(bucket_name:str, dir_path:str)->None:
+    """Delete all the objects under a directory of a bucket.
 
-    # Filter the top 10 locations for each year
-    top_10_locations = ranked_locations.filter(F.col("rank") <= 10)
+    Args:
+        bucket_name (str): bucket name
+        dir_path (str): directory path
+    """
+    client = get_storage_client()
+    for blob in client.list_blobs(bucket_name, prefix=f'{dir_path}/'):
+        blob.delete()
+
+def build_incremental_crimes_base(df:DataFrame,
+                                  spark_session:SparkSession,
+                                  bucket_name:str,
+                                  file_name:str,
+                                  year_shift:int=int(DEFAULT_JOB_OPTIONS['year_shift_years']),
+                                  storage_level:StorageLevel=StorageLevel.MEMORY_AND_DISK)->DataFrame:
+    """Same counts as build_crimes_base, but only the rows with an ID above the stored high-water mark
+    are aggregated and merged into the stored counts. The merged counts are saved as a new version.
+    Rows updated in place (same ID) are only taken into account by a full run.
 
-    name = 'top_10_theft_crimes_location_past_3y'
+    Args:
+        df (DataFrame): crimes data with the time columns
+        spark_session (SparkSession): spark session
+        bucket_name (str): data bucket name
+        file_name (str): data file name
+        year_shift (int, optional): years added to the dates of df. Defaults to DEFAULT_JOB_OPTIONS.
+        storage_level (StorageLevel, optional): cache storage level. Defaults to MEMORY_AND_DISK.
 
-    return top_10_locations, name
+    Returns:
+        tuple: crime counts with a 'count' and a 'max_id' column, path of the previous stored counts
+            (the cached counts may be recomputed from it, it is deleted by the caller at the end of the run)
+    """
+    state = get_aggregates_state(bucket_name, file_name)
+    reusable = (state.get('schema_version') == CRIMES_SCHEMA_VERSION
+                and state.get('base_version') == CRIMES_BASE_VERSION
+                and state.get('keys') == CRIMES_BASE_KEYS
+                and state.get('year_shift') == year_shift)
+
+    if reusable:
+        high_water_mark = state['high_water_mark']
+        print(f'Aggregating the rows with an ID above {high_water_mark}.')
+        delta = df.filter(F.col("ID") > high_water_mark)
+    else:
+        print('No reusable aggregates found, aggregating all the rows.')
+        delta = df
+
+    base = delta.groupBy(*CRIMES_BASE_KEYS).agg(F.count(F.lit(1)).alias("count"),
+                                                F.max("ID").alias("max_id"))
+    if reusable:
+        stored = pull_gcs_parquet_to_df(get_object_uri(bucket_name, state['path']), spark_session)
+        base = stored.unionByName(base).groupBy(*CRIMES_BASE_KEYS).agg(F.sum("count").alias("count"),
+                                                                       F.max("max_id").alias("max_id"))
+    base = base.persist(storage_level)
+
+    # Saving the merged counts also materializes the cache
+    aggregates_path = f"{AGGREGATES_PREFIX}/{file_name}/{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}"
+    load_df_to_gcs_parquet(base, get_object_uri(bucket_name, aggregates_path))
+    high_water_mark = base.agg(F.max("max_id")).first()[0]
+
+    save_aggregates_state(bucket_name, file_name, {
+        'path': aggregates_path,
+        'high_water_mark': high_water_mark if high_water_mark is not None else -1,
+        'schema_version': CRIMES_SCHEMA_VERSION,
+        'base_version': CRIMES_BASE_VERSION,
+        'keys': CRIMES_BASE_KEYS,
+        'year_shift': year_shift
+    })
+    return base, state.get('path', "")
+
+def top_k(df:DataFrame, order_col:str, k:int, rank_col:str=None)->DataFrame:
+    """Keep the rows with the k largest values of a column without moving all the rows to one partition.
+    orderBy().limit() is planned as a take ordered: each partition keeps a bounded top k, merged in a single task.
+    With a rank column, the rows tied with the k-th value are kept and ranked like rank() <= k:
+    the k largest values are collected then used as a filter threshold and a rank lookup.
 
-def total_crimes_per_year(df:DataFrame)->DataFrame:
-    # Group by year and count the total number of crimes for each year
-    total_crimes_per_year = df.groupBy("Year").count().orderBy("Year")
+    Args:
+        df (DataFrame): data to rank
+        order_col (str): column to order by, descending
+        k (int): number of rows to keep
+        rank_col (str, optional): name of the rank column, no ties are kept if None. Defaults to None.
 
-    name = 'total_crimes_per_year'
-    return total_crimes_per_year, name
+    Returns:
+        DataFrame: top k rows
+    """
+    top_rows = df.orderBy(F.desc(order_col)).limit(k)
+    if rank_col is None:
+        return top_rows
+
+    top_values = [row[0] for row in top_rows.select(order_col).collect()]
+    if not top_values:
+        return df.withColumn(rank_col, F.lit(None).cast("int")).limit(0)
+
+    # rank of a value = 1 + number of larger values, all of them being in the k largest
+    ranks = {}
+    for position, value in enumerate(top_values, start=1):
+        ranks.setdefault(value, position)
+    order_col_type = dict(df.dtypes)[order_col]
+    rank_map = F.create_map(*[item
+                              for value, rank in ranks.items()
+                              for item in (F.lit(value).cast(order_col_type), F.lit(rank))])
+
+    return (df.filter(F.col(order_col) >= top_values[-1])
+              .withColumn(rank_col, rank_map[F.col(order_col)].cast("int"))
+              .orderBy(rank_col))
+
+# Reports
+# Each report is declared by:
+#   filter: spark sql condition on the crimes base, {current_year} is replaced (optional)
+#   labels: {categorical column: label} to keep, compared as integer codes (optional)
+#   keys: group by columns, categorical columns are grouped by code and labelled at the end
+#   measure: crimes base column summed per group (MEASURES)
+#   having: spark sql condition on the groups (optional)
+#   top_k: {'k': rows to keep by descending measure, 'rank_col': rank column keeping the ties} (optional)
+#   order: output order columns, the top k are ordered by rank or measure (optional)
+#   columns: output columns, keys and measure by default (optional)
+# All the reports are computed by a single aggregation of the crimes base (see compile_reports).
+MEASURES = ['count']
+REPORTS = [
+    {'name': 'total_crimes_during_the_past_5_years_per_month',
+     'filter': 'Year >= {current_year} - 5 AND Year <= {current_year}',
+     'keys': ['Month'],
+     'measure': 'count',
+     'order': ['Month']},
+    {'name': 'top_10_theft_crimes_location_past_3y',
+     'filter': 'Year >= {current_year} - 3 AND Year <= {current_year}',
+     'labels': {'Primary Type': 'THEFT'},
+     'keys': ['Location Description'],
+     'measure': 'count',
+     'top_k': {'k': 10, 'rank_col': 'rank'}},
+    {'name': 'total_crimes_per_year',
+     'keys': ['Year'],
+     'measure': 'count',
+     'order': ['Year']},
+    {'name': 'safest_locations_4pm_to_10pm',
+     'filter': 'Hour >= 22 OR Hour <= 4',
+     'keys': ['Location Description'],
+     'measure': 'count',
+     'having': '`count` = 1',
+     'columns': ['Location Description']},
+    {'name': 'types_of_crimes_most_arrested_from_2016_to_2019',
+     'filter': 'Year >= 2016 AND Year <= 2019 AND Arrest',
+     'keys': ['Primary Type'],
+     'measure': 'count',
+     'top_k': {'k': 15}},
+]
+REPORTS_VIEW = 'crimes_base'
+
+def get_report_keys(report:dict)->list:
+    """Return the group by columns of a report in the crimes base (code columns for the categorical ones).
 
-def safest_locations_4pm_to_10pm(df:DataFrame)->DataFrame:
-    # Filter data for the time range between 10 pm and 4 am
-    nighttime_df = df.filter((F.col("Hour") >= 22) | (F.col("Hour") <= 4))
+    Args:
+        report (dict): report declaration
 
-    # Group by 'Location Description' and count the number of crimes for each location
-    location_counts = nighttime_df.groupBy("Location Description").count()
+    Returns:
+        list: crimes base columns
+    """
+    return [get_code_column(key) if key in DIMENSION_COLUMNS else key for key in report['keys']]
 
-    # Rank locations based on the count in ascending order
-    ranked_locations = location_counts.orderBy("count").filter((F.col("count") == 1))
-    
-    # Drop the 'count' column
-    ranked_locations_without_count = ranked_locations.drop("count")
+def get_report_condition(report:dict, dimensions:dict, params:dict)->str:
+    """Return the spark sql condition selecting the crimes base rows of a report.
+
+    Args:
+        report (dict): report declaration
+        dimensions (dict): {categorical column: dimension DataFrame}
+        params (dict): values replaced in the filter (current_year)
 
-    name = 'safest_locations_4pm_to_10pm'
+    Returns:
+        str: spark sql condition
+    """
+    conditions = [f"({report.get('filter', 'TRUE').format(**params)})"]
+    for column, label in report.get('labels', {}).items():
+        code = get_label_code(dimensions, column, label)
+        conditions.append('FALSE' if code is None else f'`{get_code_column(column)}` = {code}')
+    return ' AND '.join(conditions)
+
+def compile_reports(reports:list,
+                    df:DataFrame,
+                    dimensions:dict,
+                    spark_session:SparkSession,
+                    storage_level:StorageLevel=StorageLevel.MEMORY_AND_DISK)->tuple:
+    """Compute the groups of all the reports with one scan of the crimes base: a grouping sets aggregation
+    with one grouping set per distinct group by keys and one conditional sum per report.
+    Adding a report adds a column or a grouping set to this aggregation, not a scan.
+    The aggregation is cached, it has to be unpersisted by the caller.
 
-    return ranked_locations_without_count, name
+    Args:
+        reports (list): report declarations
+        df (DataFrame): crimes base
+        dimensions (dict): {categorical column: dimension DataFrame}
+        spark_session (SparkSession): spark session
+        storage_level (StorageLevel, optional): cache storage level. Defaults to MEMORY_AND_DISK.
 
-def types_of_crimes_most_arrested_2016_to_2019(df:DataFrame)->DataFrame:
-    # Filter data for the time range between 2016 and 2019 and where arrests occurred
-    arrested_df = df.filter((F.col("Year") >= 2016) & (F.col("Year") <= 2019) & (F.col("Arrest") == "true"))
+    Returns:
+        tuple: groups of all the reports (DataFrame), compiled reports (with grouping_id and measure_column)
+    """
+    params = {'current_year': get_current_year()}
+    all_keys, grouping_sets = [], []
+    for report in reports:
+        if report['measure'] not in MEASURES:
+            raise ValueError(f"Unknown measure '{report['measure']}' in report {report['name']}.")
+        keys = get_report_keys(report)
+        all_keys += [key for key in keys if key not in all_keys]
+        if keys not in grouping_sets:
+            grouping_sets.append(keys)
+
+    def quote(column:str)->str:
+        return f'`{column}`'
+
+    compiled, measures = [], []
+    for index, report in enumerate(reports):
+        keys = get_report_keys(report)
+        # GROUPING_ID bits are set for the columns not grouped, the first column being the highest bit
+        grouping_id = sum(1 << (len(all_keys) - 1 - position)
+                          for position, key in enumerate(all_keys) if key not in keys)
+        measure_column = f'report_{index}'
+        condition = get_report_condition(report, dimensions, params)
+        measures.append(f'SUM(CASE WHEN {condition} THEN {quote(report["measure"])} END) AS {measure_column}')
+        compiled.append(dict(report, grouping_id=grouping_id, measure_column=measure_column))
+
+    keys_sql = ', '.join(quote(key) for key in all_keys)
+    sets_sql = ', '.join(f"({', '.join(quote(key) for key in keys)})" for keys in grouping_sets)
+    query = (f'SELECT GROUPING_ID({keys_sql}) AS grouping_id, {keys_sql}, {", ".join(measures)}\n'
+             f'FROM {REPORTS_VIEW}\n'
+             f'GROUP BY GROUPING SETS ({sets_sql})')
+    print(f'Reports query:\n{query}')
+
+    df.createOrReplaceTempView(REPORTS_VIEW)
+    reports_df = spark_session.sql(query).persist(storage_level)
+    # materialize the cache with the single scan of the crimes base
+    print(f'{len(reports)} reports computed in {len(grouping_sets)} grouping sets: {reports_df.count()} rows.')
+    return reports_df, compiled
+
+def build_report(report:dict, reports_df:DataFrame, dimensions:dict)->DataFrame:
+    """Build the output of a compiled report from the grouping sets aggregation.
 
-    # Group by 'Primary Type' and count the number of arrests for each crime type
-    crime_counts = arrested_df.groupBy("Primary Type").count()
+    Args:
+        report (dict): compiled report
+        reports_df (DataFrame): groups of all the reports
+        dimensions (dict): {categorical column: dimension DataFrame}
 
-    # Rank crime types based on the count in descending order
-    ranked_crimes = crime_counts.orderBy(F.desc("count")).limit(15)
+    Returns:
+        DataFrame: report
+    """
+    measure = report['measure']
+    # groups without any row matching the report condition have a null sum
+    df = (reports_df.filter((F.col('grouping_id') == report['grouping_id']) & F.col(report['measure_column']).isNotNull())
+                    .select(*get_report_keys(report), F.col(report['measure_column']).alias(measure)))
+    if report.get('having'):
+        df = df.filter(F.expr(report['having']))
+
+    order = report.get('order', [])
+    if report.get('top_k'):
+        rank_col = report['top_k'].get('rank_col')
+        df = top_k(df, measure, report['top_k']['k'], rank_col=rank_col)
+        order = [rank_col] if rank_col else [F.desc(measure)]
+
+    # labels of the remaining groups only
+    labels = [key for key in report['keys'] if key in DIMENSION_COLUMNS]
+    if labels:
+        df = decode_labels(df, dimensions, *labels)
+    if report.get('columns'):
+        df = df.select(*report['columns'])
+    return df.orderBy(*order) if order else df
+
+def get_content_hash(df:DataFrame)->str:
+    """Return a hash of the content of a small dataframe, whatever the order of its rows:
+    the schema, the row count and the sum of the row hashes.
 
-    name = 'types_of_crimes_most_arrested_from_2016_to_2019'
+    Args:
+        df (DataFrame): spark DataFrame
 
-    return ranked_crimes, name
+    Returns:
+        str: content hash
+    """
+    row = df.select(F.count(F.lit(1)).alias("rows"),
+                    F.sum(F.xxhash64(*df.columns).cast("decimal(38,0)")).alias("hash")).first()
+    key = f"{df.dtypes}:{row['rows']}:{row['hash']}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
 
 def get_col_name_and_types(df:DataFrame)->tuple:
     # Get column data types
@@ -245,68 +1350,228 @@ def get_col_name_and_types(df:DataFrame)->tuple:
     
     return column_names, column_types
 
+def process_report(report:dict,
+                   reports_df:DataFrame,
+                   dimensions:dict,
+                   bucket_name:str,
+                   spark_session:SparkSession,
+                   options:dict,
+                   pool:str=None)->dict:
+    """Compute a report and write it into the sink: parquet in the data bucket,
+    a BigQuery staging table or a local SQLite file.
+
+    Args:
+        report (dict): compiled report
+        reports_df (DataFrame): groups of all the reports
+        dimensions (dict): {categorical column: dimension DataFrame}
+        bucket_name (str): data bucket name
+        spark_session (SparkSession): spark session
+        options (dict): job options
+        pool (str, optional): fair scheduler pool of the report jobs. Defaults to None.
+
+    Returns:
+        dict: table description
+    """
+    if pool:
+        # local properties are set per thread
+        spark_session.sparkContext.setLocalProperty("spark.scheduler.pool", pool)
+    name = report['name']
+    print(f'Computing {name} ...')
+    with measure_stage(name, spark_session) as metrics:
+        report_df = build_report(report, reports_df, dimensions)
+        column_names, column_types = get_col_name_and_types(report_df)
+        table = {'table_name': name,
+                 'columns': {
+                     'names': column_names,
+                     'types': column_types
+                     }}
+        metrics['table_name'] = name
+
+        if options['sink'] == 'bigquery':
+            staging_table_id = f"{options['bigquery_dataset']}.{name}{STAGING_TABLE_SUFFIX}"
+            load_df_to_bigquery(report_df, staging_table_id)
+            table['staging_table'] = staging_table_id
+            # the load function skips the tables whose content did not change
+            table['content_hash'] = get_content_hash(report_df)
+        elif options['sink'] == 'local':
+            metrics['rows'] = load_df_to_sqlite(report_df, options['local_sink_path'], name)
+            table['sink'] = 'local'
+        else:
+            file_uri = get_object_uri(bucket_name, name)
+            load_df_to_gcs_parquet(report_df, file_uri)
+            # the load function gets the exact parquet files, it does not have to list the directory
+            files = [file for file in list_gcs_dir_files(bucket_name, name) if file['name'].endswith('.parquet')]
+            metrics['output_files'], metrics['output_bytes'] = len(files), sum(file['size'] for file in files)
+            # parquet row counts are read from the files metadata
+            metrics['rows'] = spark_session.read.parquet(file_uri).count()
+            table['files'] = files
+            table['content_hash'] = get_content_hash(spark_session.read.parquet(file_uri))
+    print(f'Computing {name} ended.')
+
+    return table
+
+def run_reports(reports:list,
+                df:DataFrame,
+                dimensions:dict,
+                bucket_name:str,
+                spark_session:SparkSession,
+                options:dict)->tuple:
+    """Compute the groups of all the reports with one aggregation, then build and write the reports
+    one after another or from a thread pool. A failing report does not stop the others.
+
+    Args:
+        reports (list): report declarations
+        df (DataFrame): crimes base
+        dimensions (dict): {categorical column: dimension DataFrame}
+        bucket_name (str): data bucket name
+        spark_session (SparkSession): spark session
+        options (dict): job options, 'report_workers' reports are processed concurrently
+
+    Returns:
+        tuple: table descriptions of the written reports, {report name: error} of the failed ones
+    """
+    tables, errors = [], {}
+    workers = int(options['report_workers'])
+
+    with measure_stage('reports_aggregate', spark_session) as metrics:
+        reports_df, compiled_reports = compile_reports(reports, df, dimensions, spark_session)
+        metrics['reports'] = len(compiled_reports)
+
+    def collect(report, get_result):
+        try:
+            tables.append(get_result())
+        except Exception as e:
+            print(f"Report {report['name']} failed: {e}")
+            errors[report['name']] = str(e)
+
+    try:
+        if workers <= 1:
+            for report in compiled_reports:
+                collect(report, lambda: process_report(report, reports_df, dimensions, bucket_name,
+                                                       spark_session, options))
+            return tables, errors
+
+        print(f'Processing the reports with {workers} workers.')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_report, report, reports_df, dimensions, bucket_name, spark_session,
+                                       options, f'report_{index}')
+                       for index, report in enumerate(compiled_reports)]
+            for report, future in zip(compiled_reports, futures):
+                collect(report, future.result)
+        return tables, errors
+    finally:
+        reports_df.unpersist()
+
 # End of Processing
-def task_finished(project_id:str, topic_name:str, message:str):
-    print(f"Creating a publisher client with topic '{topic_name}'.")
-    publisher = pubsub_v1.PublisherClient()
+def encode_message(message:dict, bucket_name:str)->tuple:
+    """Encode the completion message as json. Large messages are gzip compressed,
+    and the ones still too large are written as a manifest object in GCS.
+
+    Args:
+        message (dict): completion message
+        bucket_name (str): data bucket name, where the manifests are written
+
+    Returns:
+        tuple: message data (bytes), message attributes (dict)
+    """
+    data = json.dumps(dict(message, schema_version=MESSAGE_SCHEMA_VERSION), separators=(',', ':')).encode("utf-8")
+    attributes = {'schema_version': str(MESSAGE_SCHEMA_VERSION), 'encoding': 'json'}
+    if len(data) >= MESSAGE_COMPRESS_MIN_BYTES:
+        data = gzip.compress(data)
+        attributes['encoding'] = 'gzip'
+    if len(data) > MESSAGE_MAX_BYTES:
+        manifest_path = f"{MANIFESTS_PREFIX}/{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json.gz"
+        get_storage_client().bucket(bucket_name).blob(manifest_path).upload_from_string(data, content_type="application/gzip")
+        data = json.dumps({'manifest': get_object_uri(bucket_name, manifest_path)}).encode("utf-8")
+        attributes['encoding'] = 'manifest'
+    return data, attributes
+
+def task_finished(project_id:str, topic_name:str, message:dict, bucket_name:str):
+    publisher = get_publisher_client()
     topic_path = publisher.topic_path(project_id, topic_name)
-    message_data = message
+    message_data, attributes = encode_message(message, bucket_name)
 
-    future = publisher.publish(topic_path, data=message_data.encode("utf-8"))
+    future = publisher.publish(topic_path, data=message_data, **attributes)
     future.result()
-    print(f"Message '{message}'sent to topic '{topic_name}'.")
+    print(f"Message '{message}' sent to topic '{topic_name}' ({len(message_data)} bytes, {attributes}).")
 
     return True
 
+def save_completion_marker(bucket_name:str, status:str)->None:
+    """Record in the data bucket that the completion message was published.
+
+    Args:
+        bucket_name (str): data bucket name
+        status (str): published job status
+    """
+    marker = {'status': status, 'published_at': time.time()}
+    blob = get_storage_client().bucket(bucket_name).blob(COMPLETION_MARKER_NAME)
+    blob.upload_from_string(json.dumps(marker), content_type="application/json")
+
 def main():
     print('Starting processign job.')
+    job_start = time.perf_counter()
     DATA_BUCKET_NAME, DATA_FILE_NAME, PROJECT_ID, TOPIC_NAME = get_config()
+    options = get_job_options()
+    # time between the submission by the function and the start of the job
+    startup_latency = round(time.time() - float(options['submitted_at']), 3) if options['submitted_at'] else None
 
-    unzip_files(DATA_BUCKET_NAME, DATA_FILE_NAME)
-
-    spark_session = build_spark_session('CrimesAnalysis')
-    csv_data_uri = get_object_uri(DATA_BUCKET_NAME, DATA_FILE_NAME)
+    report_workers = int(options['report_workers'])
+    spark_session = build_spark_session('CrimesAnalysis', fair_scheduling=report_workers > 1)
 
-    df_raw = pull_gcs_csv_to_df(csv_data_uri, spark_session)
-    df_0 = add_3y(df_raw)
-
-    processing_function_list = [
-        total_crimes_past_5y_per_month,
-        top_10_theft_crimes_location_past_3y,
-        total_crimes_per_year,
-        safest_locations_4pm_to_10pm,
-        types_of_crimes_most_arrested_2016_to_2019
-    ]
-
-    processing_count = len(processing_function_list)
+    processing_count = len(REPORTS)
 
     print(f'Starting processing: {processing_count} jobs:')    
     output_message = {'status':"",
-                      'tables': []}
+                      'tables': [],
+                      'result_key': options['result_key']}
+    df_0 = None
+    parsed_df = None
+    previous_aggregates_path = ""
     try:
-        for index, func in enumerate(processing_function_list, start=1):
-            print(f'Starting job n°{index}/{processing_count}.')
-            
-            print('Computing ...')
-            df, name = func(df_0)
-            column_names, column_types = get_col_name_and_types(df)
-            table_dict = {'table_name': name,
-                        'columns': {
-                            'names': column_names,
-                            'types': column_types
-                            }}
-            output_message['tables'].append(table_dict)
-            print('Computing ended.')
-
-            file_uri = get_object_uri(DATA_BUCKET_NAME, name)
-            load_df_to_gcs_parquet(df, file_uri)
-            
-            print(f'Ended job n°{index}.')
-        output_message['status'] = 'SUCCESS'
+        # the ingestion runs spark actions: its failures are published too
+        df_raw, dimensions, parsed_df = pull_crimes_df(DATA_BUCKET_NAME, DATA_FILE_NAME, spark_session, options)
+        with measure_stage('crimes_base', spark_session) as metrics:
+            if options['incremental'] == 'true':
+                df_0, previous_aggregates_path = build_incremental_crimes_base(df_raw, spark_session,
+                                                                               DATA_BUCKET_NAME, DATA_FILE_NAME,
+                                                                               get_year_shift(options))
+            else:
+                df_0 = build_crimes_base(df_raw)
+            metrics['rows'] = df_0.count()
+        if parsed_df is not None:
+            # the crimes base is cached, the parsed csv is not read again
+            parsed_df.unpersist()
+            parsed_df = None
+        tables, errors = run_reports(REPORTS, df_0, dimensions, DATA_BUCKET_NAME, spark_session, options)
+        output_message['tables'] = tables
+        if errors:
+            output_message['errors'] = errors
+        output_message['status'] = 'FAILED' if errors else 'SUCCESS'
     except Exception as e:
         print(f'Processing failed: {e}')
         output_message['status'] = 'FAILED'
-    task_finished(PROJECT_ID, TOPIC_NAME, str(output_message))
+        output_message['error'] = str(e)
+    finally:
+        if df_0 is not None:
+            df_0.unpersist()
+        if parsed_df is not None:
+            parsed_df.unpersist()
+        if previous_aggregates_path:
+            delete_gcs_dir(DATA_BUCKET_NAME, previous_aggregates_path)
+    if SCHEMA_DRIFTS:
+        output_message['schema_drifts'] = SCHEMA_DRIFTS
+
+    output_message['metrics'] = {'backend': options['backend'],
+                                 'startup_latency_s': startup_latency,
+                                 'job_duration_s': round(time.perf_counter() - job_start, 3),
+                                 'stages': STAGE_METRICS}
+    try:
+        output_message['metrics']['report_path'] = save_run_metrics(DATA_BUCKET_NAME, output_message['metrics'])
+    except Exception as e:
+        print(f'Failed to save the run metrics: {e}')
+    task_finished(PROJECT_ID, TOPIC_NAME, output_message, DATA_BUCKET_NAME)
+    save_completion_marker(DATA_BUCKET_NAME, output_message['status'])
 
 if __name__ == '__main__':
     main()
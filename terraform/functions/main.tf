@@ -29,6 +29,11 @@ resource "google_cloudfunctions_function" "start_processing_pipeline" {
       EXTRACT_TRANFORM_FUNC_NAME = var.extract_transform_function_name
       LOAD_FUNC_NAME       = var.load_function_name
       DATASET_ID                 = var.bigquery_crimes_dataset_id
+      CLUSTER_MODE               = var.dataproc_cluster_mode
+      CLUSTER_IDLE_TTL           = var.dataproc_cluster_idle_ttl
+      EXECUTION_BACKEND          = var.execution_backend
+      WATCHDOG_TOPIC             = var.pubsub_topic_watch_job_name
+      BIGQUERY_WRITE_MODE        = var.bigquery_write_mode
     }
 
   service_account_email = var.service_account_email
@@ -63,6 +68,11 @@ resource "google_cloudfunctions_function" "extract_transform_function" {
       EXTRACT_TRANFORM_FUNC_NAME = var.extract_transform_function_name
       LOAD_FUNC_NAME       = var.load_function_name
       DATASET_ID                 = var.bigquery_crimes_dataset_id
+      CLUSTER_MODE               = var.dataproc_cluster_mode
+      CLUSTER_IDLE_TTL           = var.dataproc_cluster_idle_ttl
+      EXECUTION_BACKEND          = var.execution_backend
+      WATCHDOG_TOPIC             = var.pubsub_topic_watch_job_name
+      BIGQUERY_WRITE_MODE        = var.bigquery_write_mode
     }
 
   service_account_email = var.service_account_email
@@ -98,7 +108,51 @@ resource "google_cloudfunctions_function" "load_and_function" {
       EXTRACT_TRANFORM_FUNC_NAME = var.extract_transform_function_name
       LOAD_FUNC_NAME             = var.load_function_name
       DATASET_ID                 = var.bigquery_crimes_dataset_id
+      CLUSTER_MODE               = var.dataproc_cluster_mode
+      CLUSTER_IDLE_TTL           = var.dataproc_cluster_idle_ttl
+      EXECUTION_BACKEND          = var.execution_backend
+      WATCHDOG_TOPIC             = var.pubsub_topic_watch_job_name
+      BIGQUERY_WRITE_MODE        = var.bigquery_write_mode
     }
 
   service_account_email = var.service_account_email
-}
\ No newline at end of file
+}
+
+resource "google_cloudfunctions_function" "watch_job_function" {
+  name                  = var.watch_job_function_name
+  description           = "Follow the dataproc job, clean up and retry failed or stalled jobs"
+  runtime               = var.runtime
+  source_archive_bucket = var.functions_bucket_name
+  source_archive_object = var.functions_zip_file_name
+  entry_point           = var.watch_job_function_name
+  region                = var.gcp_region
+  timeout               = 540
+
+  event_trigger {
+    event_type = "google.pubsub.topic.publish"
+    resource   = var.pubsub_topic_watch_job_name
+  }
+
+    environment_variables = {
+      PROJECT                    = var.gcp_project
+      REGION                     = var.gcp_region
+      CLUSTER_NAME               = var.dataproc_cluster_name
+      JOB_BUCKET_NAME            = var.job_bucket_name
+      JOB_FILE_NAME              = var.job_file_name
+      DATA_BUCKET_NAME           = var.data_bucket_name
+      DATA_FILE_NAME             = var.data_file_name
+      DATA_ZIP_FILE_NAME         = var.data_zip_file_name
+      EXTRACT_TRANSFORM_TOPIC    = var.pubsub_topic_extract_transform_name
+      LOAD_TRANSFORM_TOPIC       = var.pubsub_topic_load_name
+      EXTRACT_TRANFORM_FUNC_NAME = var.extract_transform_function_name
+      LOAD_FUNC_NAME             = var.load_function_name
+      DATASET_ID                 = var.bigquery_crimes_dataset_id
+      CLUSTER_MODE               = var.dataproc_cluster_mode
+      CLUSTER_IDLE_TTL           = var.dataproc_cluster_idle_ttl
+      EXECUTION_BACKEND          = var.execution_backend
+      WATCHDOG_TOPIC             = var.pubsub_topic_watch_job_name
+      BIGQUERY_WRITE_MODE        = var.bigquery_write_mode
+    }
+
+  service_account_email = var.service_account_email
+}
@@ -43,6 +43,7 @@ module "functions" {
   runtime = var.functions_runtime
   extract_transform_function_name = var.extract_transform_function_name
   load_function_name = var.load_function_name
+  watch_job_function_name = var.watch_job_function_name
   start_processing_pipeline_name = var.start_processing_pipeline_name
   functions_bucket_name = module.storage.functions_bucket_name
   functions_zip_file_name = module.storage.functions_zip_file_name
@@ -56,10 +57,16 @@ module "functions" {
 
   pubsub_topic_extract_transform_name = var.pubsub_topic_extract_transform_name
   pubsub_topic_load_name = var.pubsub_topic_load_name
+  pubsub_topic_watch_job_name = var.pubsub_topic_watch_job_name
 
   bigquery_crimes_dataset_id = var.bigquery_crimes_dataset_id
+  bigquery_write_mode = var.bigquery_write_mode
 
   dataproc_cluster_name = var.dataproc_cluster_name
+  dataproc_cluster_mode = var.dataproc_cluster_mode
+  dataproc_cluster_idle_ttl = var.dataproc_cluster_idle_ttl
+
+  execution_backend = var.execution_backend
 }
 
 # I.A.M
@@ -81,6 +88,7 @@ module "pubsub" {
 
   pubsub_topic_start_pipeline_name = var.pubsub_topic_extract_transform_name
   pubsub_topic_job_ended_name = var.pubsub_topic_load_name
+  pubsub_topic_watch_job_name = var.pubsub_topic_watch_job_name
   gcp_project = var.gcp_project
 }
 
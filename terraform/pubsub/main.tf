@@ -6,3 +6,7 @@ resource "google_pubsub_topic" "pubsub_topic_load_clean_ended" {
   name = var.pubsub_topic_job_ended_name
   project = var.gcp_project
 }
+resource "google_pubsub_topic" "pubsub_topic_watch_job" {
+  name = var.pubsub_topic_watch_job_name
+  project = var.gcp_project
+}
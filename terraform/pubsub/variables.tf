@@ -6,6 +6,10 @@ variable "pubsub_topic_start_pipeline_name" {
     type = string
 }
 
+variable "pubsub_topic_watch_job_name" {
+    type = string
+}
+
 variable "gcp_project" {
     type = string
 }
\ No newline at end of file
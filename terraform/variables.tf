@@ -22,6 +22,9 @@ variable "extract_transform_function_name" {
 variable "load_function_name" {
   type = string
 }
+variable "watch_job_function_name" {
+  type = string
+}
 variable "start_processing_pipeline_name" {
   type = string
 }
@@ -61,13 +64,30 @@ variable "pubsub_topic_extract_transform_name" {
 variable "pubsub_topic_load_name" {
   type = string
 }
+variable "pubsub_topic_watch_job_name" {
+  type = string
+}
 
 # BigQuery
 variable "bigquery_crimes_dataset_id" {
   type = string
 }
+variable "bigquery_write_mode" {
+  type = string
+}
 
 # Dataproc
 variable "dataproc_cluster_name" {
   type = string
-}
\ No newline at end of file
+}
+variable "dataproc_cluster_mode" {
+  type = string
+}
+variable "dataproc_cluster_idle_ttl" {
+  type = number
+}
+
+# Job execution backend
+variable "execution_backend" {
+  type = string
+}
@@ -0,0 +1,76 @@
+"""Cold start import cost of the Cloud Functions entry points.
+
+Each measure runs in a new python interpreter: it imports main.py then loads the SDKs
+the entry point uses (ENTRY_POINT_MODULES), as a cold instance does on its first invocation.
+Run it after changing requirements.txt to spot import time regressions.
+
+Usage:
+    python tools/functions/benchmark.py --runs 5
+    python tools/functions/benchmark.py --runs 5 --max-seconds 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'functions')
+sys.path.insert(0, FUNCTIONS_DIR)
+import main
+
+MEASURE_CODE = '''
+import time
+start = time.perf_counter()
+import main
+main_import = time.perf_counter() - start
+for module in main.ENTRY_POINT_MODULES[{entry_point!r}]:
+    module.load()
+print(main_import, time.perf_counter() - start)
+'''
+
+def measure_entry_point(entry_point:str)->tuple:
+    """Measure the import cost of an entry point in a new interpreter.
+
+    Args:
+        entry_point (str): entry point name
+
+    Returns:
+        tuple: main.py import seconds, total import seconds
+    """
+    output = subprocess.run([sys.executable, '-c', MEASURE_CODE.format(entry_point=entry_point)],
+                            cwd=FUNCTIONS_DIR,
+                            check=True, capture_output=True, text=True).stdout
+    main_import, total = output.split()
+    return float(main_import), float(total)
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description='Measure the cold start import cost of the entry points.')
+    parser.add_argument('--runs', type=int, default=5, help='measures per entry point')
+    parser.add_argument('--output', default='cold_start_results.json', help='results json file')
+    parser.add_argument('--max-seconds', type=float, default=None, help='fail if an entry point imports take longer')
+    args = parser.parse_args()
+
+    results = {}
+    for entry_point in main.ENTRY_POINT_MODULES:
+        measures = [measure_entry_point(entry_point) for _ in range(args.runs)]
+        results[entry_point] = {
+            'modules': [module.name for module in main.ENTRY_POINT_MODULES[entry_point]],
+            'main_import_s': round(statistics.median(measure[0] for measure in measures), 4),
+            'total_import_s': round(statistics.median(measure[1] for measure in measures), 4),
+        }
+        print(f"{entry_point:<28} main.py {results[entry_point]['main_import_s']:.3f}s, "
+              f"with SDKs {results[entry_point]['total_import_s']:.3f}s {results[entry_point]['modules']}")
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results saved in {args.output}')
+
+    if args.max_seconds is not None:
+        slow = [name for name, result in results.items() if result['total_import_s'] > args.max_seconds]
+        if slow:
+            print(f'Entry points above {args.max_seconds}s: {slow}')
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main_benchmark()
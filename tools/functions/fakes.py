@@ -0,0 +1,211 @@
+"""Offline fakes of the Dataproc and Pub Sub clients, to run the job watchdog without GCP.
+
+The fakes replace the client factories of main.py, then watch_job is invoked on an encoded watch message.
+Running this file plays the watchdog scenarios with a fake clock.
+
+Usage:
+    python tools/functions/fakes.py
+"""
+import base64
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'functions')
+sys.path.insert(0, FUNCTIONS_DIR)
+import main
+
+class FakeOperation:
+    """Long running operation already done."""
+    def __init__(self, result=None, job_id:str=None):
+        self._result = result
+        self.reference = SimpleNamespace(job_id=job_id)
+
+    def result(self, timeout=None):
+        return self._result
+
+class FakeJobControllerClient:
+    """Job controller returning scripted job states, the last state is kept once the script ends."""
+    def __init__(self, states:list):
+        self.states = list(states)
+        self.cancelled = []
+        self.submitted = []
+
+    def get_job(self, project_id:str, region:str, job_id:str):
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        return SimpleNamespace(status=SimpleNamespace(state=SimpleNamespace(name=state)))
+
+    def cancel_job(self, project_id:str, region:str, job_id:str):
+        self.cancelled.append(job_id)
+        self.states = ['CANCELLED']
+
+    def submit_job(self, request:dict):
+        job_id = f'fake-job-{len(self.submitted)}'
+        self.submitted.append(request['job'])
+        return FakeOperation(job_id=job_id)
+
+    def list_jobs(self, request:dict):
+        return []
+
+class FakeClusterControllerClient:
+    """Cluster controller keeping the cluster names in memory."""
+    def __init__(self, clusters:list=None):
+        self.clusters = set(clusters or [])
+        self.deleted = []
+
+    def get_cluster(self, project_id:str, region:str, cluster_name:str):
+        if cluster_name not in self.clusters:
+            raise LookupError(f'Cluster {cluster_name} not found')
+        return SimpleNamespace(cluster_name=cluster_name, status=SimpleNamespace(state=SimpleNamespace(name='RUNNING')))
+
+    def create_cluster(self, request:dict):
+        cluster_name = request['cluster']['cluster_name']
+        self.clusters.add(cluster_name)
+        return FakeOperation(SimpleNamespace(cluster_name=cluster_name))
+
+    def delete_cluster(self, project_id:str, region:str, cluster_name:str):
+        self.clusters.discard(cluster_name)
+        self.deleted.append(cluster_name)
+        return FakeOperation()
+
+class FakeBatchControllerClient:
+    """Batch controller returning scripted batch states, the last state is kept once the script ends."""
+    def __init__(self, states:list):
+        self.states = list(states)
+        self.cancelled = []
+
+    def get_batch(self, name:str):
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        return SimpleNamespace(state=SimpleNamespace(name=state), operation=f'{name}/operation')
+
+    def cancel_operation(self, request:dict):
+        self.cancelled.append(request['name'])
+        self.states = ['CANCELLED']
+
+class FakeBucketClient:
+    """Bucket keeping the object contents in memory."""
+    def __init__(self, objects:dict=None):
+        self.objects = dict(objects or {})
+
+    def get_blob(self, name:str):
+        if name not in self.objects:
+            return None
+        return SimpleNamespace(name=name, download_as_text=lambda: self.objects[name])
+
+class FakePublisherClient:
+    """Publisher keeping the published messages per topic."""
+    def __init__(self):
+        self.messages = []
+
+    def topic_path(self, project_id:str, topic:str)->str:
+        return topic
+
+    def publish(self, topic_path:str, data:bytes, **attributes):
+        self.messages.append((topic_path, data.decode('utf-8')))
+        return FakeOperation()
+
+class FakeClock:
+    """Clock moving forward only when sleeping."""
+    def __init__(self, now:float=0.0):
+        self.now = now
+
+    def time(self)->float:
+        return self.now
+
+    def sleep(self, seconds:float)->None:
+        self.now += seconds
+
+def install_fakes(config:dict, states:list, published_at:float, batch:bool)->tuple:
+    """Replace the client factories and the publishing function of main.py by the fakes.
+
+    Args:
+        config (dict): main configuration dict, returned by get_config
+        states (list): scripted job states, batch states for a batch
+        published_at (float): unix time written in the completion marker, None for no marker
+        batch (bool): follow a serverless batch instead of a cluster job
+
+    Returns:
+        tuple: job (or batch) client, cluster client, publisher client
+    """
+    job_client = FakeBatchControllerClient(states) if batch else FakeJobControllerClient(states)
+    cluster_client = FakeClusterControllerClient([config['cluster_name']])
+    marker = json.dumps({'status': 'SUCCESS', 'published_at': published_at})
+    bucket_client = FakeBucketClient({main.COMPLETION_MARKER_NAME: marker} if published_at is not None else {})
+    publisher = FakePublisherClient()
+
+    main.get_config = lambda: dict(config)
+    main.create_job_client = lambda config: job_client
+    main.create_batch_client = lambda config: job_client
+    main.create_cluster_client = lambda config: cluster_client
+    main.create_bucket_client = lambda config: bucket_client
+    main.publish_message_in_topic = lambda project_id, topic, message: publisher.publish(topic, message.encode('utf-8'))
+    return job_client, cluster_client, publisher
+
+def run_scenario(name:str, states:list, attempt:int=0, submitted_ago:float=0, batch:bool=False,
+                 published:bool=True)->tuple:
+    """Play one watch_job invocation on scripted job states.
+
+    Args:
+        name (str): scenario name
+        states (list): scripted job states, batch states for a batch
+        attempt (int, optional): job attempt. Defaults to 0.
+        submitted_ago (float, optional): seconds since the job submission. Defaults to 0.
+        batch (bool, optional): follow a serverless batch instead of a cluster job. Defaults to False.
+        published (bool, optional): the job wrote its completion marker. Defaults to True.
+
+    Returns:
+        tuple: watch message, fake clients
+    """
+    config = {'project_id': 'fake-project', 'region': 'europe-west1', 'cluster_name': 'fake-cluster',
+              'execution_backend': 'serverless' if batch else 'cluster', 'cluster_mode': 'ephemeral',
+              'extract_transform_topic_name': 'extract_transform',
+              'watchdog_topic_name': 'watch_job', 'max_job_retries': 1, 'job_stall_timeout': 900,
+              'max_job_duration': 10800, 'watchdog_poll_budget': 300}
+    clock = FakeClock(100000.0)
+    watch = {'job_id': '' if batch else 'fake-job-0', 'batch_id': 'fake-batch-0' if batch else '',
+             'attempt': attempt, 'size_index': 1, 'submitted_at': clock.time() - submitted_ago}
+    job_client, cluster_client, publisher = install_fakes(config, states, clock.time() if published else None, batch)
+
+    event = {'data': base64.b64encode(json.dumps(watch).encode('utf-8'))}
+    main.watch_job(event, None, sleep=clock.sleep, clock=clock.time)
+    print(f'{name}: cancelled {job_client.cancelled}, deleted {cluster_client.deleted}, '
+          f'published {publisher.messages}')
+    return watch, (job_client, cluster_client, publisher)
+
+def main_scenarios():
+    _, (_, clusters, publisher) = run_scenario('done', ['PENDING', 'RUNNING', 'RUNNING', 'DONE'])
+    assert not clusters.deleted and not publisher.messages
+
+    _, (_, clusters, publisher) = run_scenario('done without message', ['RUNNING', 'DONE'], published=False)
+    assert clusters.deleted == ['fake-cluster'] and not publisher.messages
+
+    _, (_, clusters, publisher) = run_scenario('failed', ['RUNNING', 'ERROR'], published=False)
+    assert clusters.deleted == ['fake-cluster']
+    assert publisher.messages == [('extract_transform', '{"attempt": 1, "size_index": 2}')]
+
+    _, (jobs, _, publisher) = run_scenario('stalled', ['PENDING'], submitted_ago=1000, published=False)
+    assert jobs.cancelled == ['fake-job-0'] and len(publisher.messages) == 1
+
+    watch, (_, clusters, publisher) = run_scenario('still running', ['RUNNING'])
+    assert not clusters.deleted and publisher.messages == [('watch_job', json.dumps(watch))]
+
+    _, (_, clusters, publisher) = run_scenario('failed after publishing', ['RUNNING', 'ERROR'])
+    assert clusters.deleted == ['fake-cluster'] and not publisher.messages
+
+    _, (jobs, _, publisher) = run_scenario('stalled after publishing', ['RUNNING'], submitted_ago=20000)
+    assert jobs.cancelled == ['fake-job-0'] and not publisher.messages
+
+    _, (_, clusters, publisher) = run_scenario('no retry left', ['ERROR'], attempt=1, published=False)
+    assert clusters.deleted == ['fake-cluster'] and not publisher.messages
+
+    _, (batches, clusters, publisher) = run_scenario('batch done', ['PENDING', 'RUNNING', 'SUCCEEDED'], batch=True)
+    assert not batches.cancelled and not clusters.deleted and not publisher.messages
+
+    _, (batches, clusters, publisher) = run_scenario('batch stalled', ['PENDING'], submitted_ago=1000, batch=True,
+                                                     published=False)
+    assert len(batches.cancelled) == 1 and not clusters.deleted and len(publisher.messages) == 1
+    print('All watchdog scenarios passed.')
+
+if __name__ == '__main__':
+    main_scenarios()